@@ -0,0 +1,56 @@
+"""
+Scores many positions at once with NumPy, for self-play analysis and tuning
+where millions of positions need the evaluator's score. Boards are turned into
+an (N, 12, 64) array of piece planes read from their bitboards, and the planes
+are scored against the piece-square tables in one matrix product. Scores are
+the same as evaluation.board_score: white's material and position minus
+black's, with checkmate left to the caller as in the search.
+"""
+import numpy as np
+
+import chess
+
+import evaluation
+
+# Plane order: white pawn, knight, bishop, rook, queen, king, then black's
+PLANES = [(color, piece_type) for color in (chess.WHITE, chess.BLACK) for piece_type in chess.PIECE_TYPES]
+# SCORE_TABLE[plane][square] is the signed score of that piece on that square
+SCORE_TABLE = np.array([evaluation.SQUARE_SCORES[color][piece_type] for color, piece_type in PLANES], dtype=np.int64)
+SCORE_VECTOR = SCORE_TABLE.reshape(-1).astype(np.float32)
+
+
+# Returns an (N, 12) array of the boards' piece bitboards in plane order
+def board_masks(fen_boards):
+    masks = np.empty((len(fen_boards), len(PLANES)), dtype="<u8")
+    for index, fen_board in enumerate(fen_boards):
+        white = fen_board.occupied_co[chess.WHITE]
+        black = fen_board.occupied_co[chess.BLACK]
+        pieces = (fen_board.pawns, fen_board.knights, fen_board.bishops,
+                  fen_board.rooks, fen_board.queens, fen_board.kings)
+        masks[index] = [mask & white for mask in pieces] + [mask & black for mask in pieces]
+    return masks
+
+
+# Returns the (N, 12, 64) uint8 piece planes of the boards: planes[n, p, s] is 1
+# when board n has plane p's piece on chess.Square s
+def board_planes(fen_boards):
+    masks = board_masks(fen_boards)
+    # Little-endian bytes unpacked least significant bit first give square order
+    bits = np.unpackbits(masks.view(np.uint8), axis=1, bitorder="little")
+    return bits.reshape(len(fen_boards), len(PLANES), 64)
+
+
+# Scores (N, 12, 64) piece planes, returning an int64 array of N scores. The
+# product runs in float32, which is exact here: a board's score and every
+# partial sum are whole numbers far below 2 ** 24.
+def evaluate_planes(planes):
+    planes = np.asarray(planes)
+    scores = planes.reshape(len(planes), -1).astype(np.float32) @ SCORE_VECTOR
+    return scores.round().astype(np.int64)
+
+
+# Scores a list of chess.Boards, returning an int64 array of their scores
+def evaluate_boards(fen_boards):
+    if not fen_boards:
+        return np.zeros(0, dtype=np.int64)
+    return evaluate_planes(board_planes(fen_boards))
@@ -0,0 +1,81 @@
+"""
+Compares the throughput (positions per second) of batch_evaluation against
+chess_ai.evaluate_board_score and evaluation.board_score, and checks that all
+three give the same scores. The batch is made of seeded random games played
+from every position in positions.epd.
+Run from the repository root: python -m benchmarks.batch_eval [positions]
+"""
+import random
+import sys
+import time
+
+import batch_evaluation
+import chess_ai
+import evaluation
+import position_status
+from benchmarks.common import load_positions
+
+BATCH_SIZE = 20000
+WALK_LENGTH = 40
+
+
+# Returns count positions visited by random games from the EPD positions,
+# leaving out checkmates since the evaluators only score material and position
+def random_positions(count, seed=0):
+    rng = random.Random(seed)
+    starts = [fen_board for _, fen_board in load_positions()]
+    positions = []
+    while len(positions) < count:
+        fen_board = rng.choice(starts).copy(stack=False)
+        for _ in range(WALK_LENGTH):
+            moves = list(fen_board.legal_moves)
+            if not moves or len(positions) >= count:
+                break
+            fen_board.push(rng.choice(moves))
+            if not fen_board.is_checkmate():
+                positions.append(fen_board.copy(stack=False))
+    return positions
+
+
+# Runs function and returns (its result, positions per second)
+def throughput(function, positions):
+    start = time.perf_counter()
+    result = function(positions)
+    return result, len(positions) / (time.perf_counter() - start)
+
+
+def reference_scores(positions):
+    return [chess_ai.evaluate_board_score(fen_board, position_status.fen_to_board(fen_board.fen()), 'w')
+            for fen_board in positions]
+
+
+def scalar_scores(positions):
+    return [evaluation.board_score(fen_board) for fen_board in positions]
+
+
+def main(count=BATCH_SIZE):
+    positions = random_positions(count)
+    planes = batch_evaluation.board_planes(positions)
+    rows = []
+    reference, rate = throughput(reference_scores, positions)
+    rows.append(("chess_ai.evaluate_board_score", rate))
+    scalar, rate = throughput(scalar_scores, positions)
+    rows.append(("evaluation.board_score", rate))
+    batch, rate = throughput(batch_evaluation.evaluate_boards, positions)
+    rows.append(("batch_evaluation.evaluate_boards", rate))
+    _, rate = throughput(batch_evaluation.board_planes, positions)
+    rows.append(("  board_planes only", rate))
+    _, rate = throughput(batch_evaluation.evaluate_planes, planes)
+    rows.append(("  evaluate_planes only", rate))
+    print("{} positions".format(len(positions)))
+    for name, rate in rows:
+        print("{:<36} {:>12.0f} positions/sec".format(name, rate))
+    mismatches = sum(1 for expected, score, batch_score in zip(reference, scalar, batch)
+                     if not expected == score == batch_score)
+    print("{} mismatches".format(mismatches))
+    return mismatches
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    sys.exit(1 if main(int(arguments[0]) if arguments else BATCH_SIZE) else 0)
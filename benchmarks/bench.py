@@ -0,0 +1,148 @@
+"""
+Benchmark harness for the engine, evaluator and opening book. Like Stockfish's
+bench command it searches every position in positions.epd to a fixed depth and
+reports the total node count as a signature: the count only changes when the
+search's behavior does. It also times the hot functions on the same positions.
+Run from the repository root:
+python -m benchmarks.bench [--json out.json] [--baseline benchmarks/baseline.json] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import chess
+import chess.engine
+import chess.polyglot
+
+import chess_ai
+import evaluation
+import opening_book
+import position_status
+import search
+from benchmarks.common import load_positions
+
+BENCH_DEPTH = 3
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Minimum time spent timing each microbenchmark
+MICRO_SECONDS = 0.5
+
+
+def turn_of(fen_board):
+    return 'w' if fen_board.turn == chess.WHITE else 'b'
+
+
+# Searches every position to BENCH_DEPTH with a fresh Searcher and returns
+# (total nodes, seconds)
+def run_search(positions):
+    total_nodes = 0
+    start = time.perf_counter()
+    for _, fen_board in positions:
+        if fen_board.is_game_over():
+            continue
+        result = search.Searcher().search(fen_board, turn_of(fen_board), chess.engine.Limit(depth=BENCH_DEPTH))
+        total_nodes += result.nodes
+    return total_nodes, time.perf_counter() - start
+
+
+# Calls function on every position repeatedly for about MICRO_SECONDS and
+# returns the number of calls per second
+def time_calls(function, arguments):
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for argument in arguments:
+            function(argument)
+        calls += len(arguments)
+        elapsed = time.perf_counter() - start
+        if elapsed >= MICRO_SECONDS:
+            return calls / elapsed
+
+
+def push_pop_all(evaluator):
+    for move in list(evaluator.board.legal_moves):
+        evaluator.push(move)
+        evaluator.pop()
+
+
+def microbenchmarks(positions):
+    boards = [fen_board for _, fen_board in positions]
+    fens = [fen_board.fen() for fen_board in boards]
+    parsed = [(fen_board, position_status.fen_to_board(fen_board.fen())) for fen_board in boards]
+    evaluators = [evaluation.Evaluator(fen_board.copy()) for fen_board in boards]
+    book = opening_book.get_book()
+    # Book probes from the positions the book knows, bypassing the probe cache
+    book_boards = [chess.Board()]
+    for move in ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5"]:
+        book_boards.append(book_boards[-1].copy())
+        book_boards[-1].push_uci(move)
+    return {
+        "fen_to_board": time_calls(position_status.fen_to_board, fens),
+        "position_status_from_board": time_calls(position_status.PositionStatus.from_board, boards),
+        "evaluate_board_score": time_calls(lambda item: chess_ai.evaluate_board_score(item[0], item[1], 'w'), parsed),
+        "evaluation.board_score": time_calls(evaluation.board_score, boards),
+        "evaluator_push_pop_all_moves": time_calls(push_pop_all, evaluators),
+        "legal_move_generation": time_calls(lambda fen_board: list(fen_board.legal_moves), boards),
+        "book_probe": time_calls(lambda fen_board: book.read_entries(fen_board, chess.polyglot.zobrist_hash(fen_board)), book_boards),
+        "book_probe_cached": time_calls(book.entries, book_boards),
+    }
+
+
+def run_bench():
+    positions = load_positions()
+    nodes, seconds = run_search(positions)
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "positions": len(positions),
+        "depth": BENCH_DEPTH,
+        "signature": nodes,
+        "search_seconds": round(seconds, 4),
+        "nps": round(nodes / seconds),
+        "calls_per_second": {name: round(rate, 1) for name, rate in microbenchmarks(positions).items()},
+    }
+
+
+def print_report(report, baseline=None):
+    print("positions: {}  depth: {}".format(report["positions"], report["depth"]))
+    line = "signature: {}".format(report["signature"])
+    if baseline is not None and baseline["signature"] != report["signature"]:
+        line += "  (baseline {}: search behavior changed)".format(baseline["signature"])
+    print(line)
+    rows = [("search nodes/sec", report["nps"], baseline and baseline["nps"])]
+    for name, rate in report["calls_per_second"].items():
+        rows.append((name + " calls/sec", rate, baseline and baseline["calls_per_second"].get(name)))
+    for name, value, base_value in rows:
+        if base_value:
+            print("{:<42} {:>12.0f}  {:+6.1f}%".format(name, value, 100.0 * (value / base_value - 1)))
+        else:
+            print("{:<42} {:>12.0f}".format(name, value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the engine, evaluator and opening book.")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="compare against a report written earlier")
+    parser.add_argument("--save-baseline", action="store_true", help="write the report to " + BASELINE_PATH)
+    args = parser.parse_args()
+    report = run_bench()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+    # A changed signature fails the run so behavior changes are noticed
+    if baseline is not None and baseline["signature"] != report["signature"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
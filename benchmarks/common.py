@@ -0,0 +1,19 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+import os
+
+import chess
+
+POSITIONS_PATH = os.path.join(os.path.dirname(__file__), "positions.epd")
+
+
+# Returns (id, board) for every position in the EPD file
+def load_positions(path=POSITIONS_PATH):
+    positions = []
+    with open(path) as epd_file:
+        for line in epd_file:
+            if line.strip():
+                fen_board, operations = chess.Board.from_epd(line)
+                positions.append((operations.get("id", fen_board.fen()), fen_board))
+    return positions
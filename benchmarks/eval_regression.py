@@ -0,0 +1,61 @@
+"""
+Checks that evaluation.Evaluator gives the same scores as
+chess_ai.evaluate_board_score. Every position in positions.epd is scored from
+scratch, then a few seeded random games are played from it through the
+evaluator's push/pop and every visited position is compared again.
+Run from the repository root: python -m benchmarks.eval_regression
+"""
+import random
+import sys
+
+import chess_ai
+import evaluation
+import position_status
+from benchmarks.common import load_positions
+
+WALKS_PER_POSITION = 8
+WALK_LENGTH = 40
+
+
+# The reference score. Checkmated positions are skipped because the search
+# scores those itself; only material and position are compared.
+def reference_score(fen_board):
+    board = position_status.fen_to_board(fen_board.fen())
+    return chess_ai.evaluate_board_score(fen_board, board, 'w')
+
+
+def compare(name, fen_board, score, failures):
+    if fen_board.is_checkmate():
+        return 0
+    expected = reference_score(fen_board)
+    if score != expected:
+        failures.append("{}: {} scored {} instead of {}".format(name, fen_board.fen(), score, expected))
+    return 1
+
+
+def run(seed=0):
+    rng = random.Random(seed)
+    failures = []
+    checked = 0
+    for name, fen_board in load_positions():
+        checked += compare(name, fen_board, evaluation.board_score(fen_board), failures)
+        for _ in range(WALKS_PER_POSITION):
+            evaluator = evaluation.Evaluator(fen_board.copy())
+            for _ in range(WALK_LENGTH):
+                moves = list(evaluator.board.legal_moves)
+                if not moves:
+                    break
+                evaluator.push(rng.choice(moves))
+                checked += compare(name, evaluator.board, evaluator.score, failures)
+            while evaluator.history:
+                evaluator.pop()
+            checked += compare(name, evaluator.board, evaluator.score, failures)
+    return checked, failures
+
+
+if __name__ == "__main__":
+    checked, failures = run()
+    for failure in failures:
+        print(failure)
+    print("{} positions checked, {} mismatches".format(checked, len(failures)))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,84 @@
+"""
+Measures frame times and CPU use of the game window on a hidden display. By
+default the AI plays both sides in run_game.init_game for a fixed number of
+seconds; with "idle" a two player game is left open without any input.
+Run from the repository root:
+python -m benchmarks.frame_times [difficulty | idle] [seconds]
+"""
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame as p
+
+import run_game
+
+DURATION = 20.0
+
+
+class BenchmarkFinished(Exception):
+    pass
+
+
+# Stands in for the pygame clock and records the time between frames
+class FrameClock(object):
+    def __init__(self, duration):
+        self.clock = p.time.Clock()
+        self.duration = duration
+        self.frame_times = []
+        self.start = time.perf_counter()
+        self.last = self.start
+
+    def tick(self, framerate=0):
+        result = self.clock.tick(framerate)
+        now = time.perf_counter()
+        self.frame_times.append(now - self.last)
+        self.last = now
+        if now - self.start > self.duration:
+            raise BenchmarkFinished()
+        return result
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main(difficulty=1700, duration=DURATION):
+    p.init()
+    display = p.display.set_mode((run_game.SQUARE_DIM * run_game.ROW_DIM, run_game.SQUARE_DIM * run_game.ROW_DIM))
+    clock = FrameClock(duration)
+    cpu_start = time.process_time()
+    if difficulty == 'idle':
+        # Nothing ticks the clock while the window waits for input, so quit from a timer
+        threading.Timer(duration, p.event.post, (p.event.Event(p.QUIT),)).start()
+        try:
+            run_game.init_game(display, clock, False, 1500, 'white')
+        except BenchmarkFinished:
+            pass
+    else:
+        run_game.human_turn = lambda turn, single_player_mode, start_color: False
+        try:
+            while True:
+                run_game.init_game(display, clock, True, difficulty, 'white')
+        except BenchmarkFinished:
+            pass
+    cpu_time = time.process_time() - cpu_start
+    frames = clock.frame_times
+    print("{} frames in {:.1f}s ({})".format(len(frames), duration, difficulty))
+    if frames:
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            print("{}: {:.1f} ms".format(name, 1000 * percentile(frames, fraction)))
+        print("max: {:.1f} ms".format(1000 * max(frames)))
+    print("cpu: {:.1f}s ({:.0f}% of one core)".format(cpu_time, 100 * cpu_time / duration))
+    p.quit()
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    level = arguments[0] if arguments else '1700'
+    if level != 'idle':
+        level = int(level)
+    main(level, float(arguments[1]) if len(arguments) > 1 else DURATION)
@@ -0,0 +1,91 @@
+"""
+Load test for server.py. A number of concurrent clients send move requests for
+the positions in positions.epd to a running server, over HTTP or WebSocket,
+and the script reports throughput, latency percentiles, the responses by
+status and the server's own metrics.
+Start the server first (python server.py), then from the repository root:
+python -m benchmarks.load_test [--clients 8] [--requests 200] [--levels 1500,1600] [--websocket]
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import random
+import time
+
+import aiohttp
+
+from benchmarks.common import load_positions
+
+DEFAULT_URL = "http://127.0.0.1:8080"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+# Returns the request bodies, cycling through the positions with random levels
+def make_requests(count, levels, deadline_ms, seed=0):
+    rng = random.Random(seed)
+    fens = [fen_board.fen() for _, fen_board in load_positions() if not fen_board.is_game_over()]
+    return [{"fen": fen, "moves": [], "level": rng.choice(levels), "deadline_ms": deadline_ms}
+            for fen in itertools.islice(itertools.cycle(fens), count)]
+
+
+# One HTTP client: sends the requests one after another
+async def http_client(session, url, requests, results):
+    for body in requests:
+        start = time.perf_counter()
+        async with session.post(url + "/move", json=body) as response:
+            await response.read()
+            results.append((response.status, time.perf_counter() - start))
+
+
+# One WebSocket client: sends the requests one after another on one socket
+async def websocket_client(session, url, requests, results):
+    async with session.ws_connect(url + "/ws") as socket:
+        for number, body in enumerate(requests):
+            start = time.perf_counter()
+            await socket.send_json(dict(body, id=number))
+            answer = await socket.receive_json()
+            results.append((answer["status"], time.perf_counter() - start))
+
+
+async def run(url, clients, requests, websocket):
+    results = []
+    client = websocket_client if websocket else http_client
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session, url, requests[index::clients], results) for index in range(clients)])
+        elapsed = time.perf_counter() - start
+        async with session.get(url + "/metrics") as response:
+            metrics = await response.json()
+    return results, elapsed, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a running move server.")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--levels", default="1500,1600", help="comma separated ratings to ask for")
+    parser.add_argument("--deadline-ms", type=int, default=5000)
+    parser.add_argument("--websocket", action="store_true", help="use the WebSocket endpoint instead of HTTP")
+    args = parser.parse_args()
+    requests = make_requests(args.requests, [int(level) for level in args.levels.split(",")], args.deadline_ms)
+    results, elapsed, metrics = asyncio.run(run(args.url, args.clients, requests, args.websocket))
+    latencies = [seconds for status, seconds in results if status == 200]
+    statuses = collections.Counter(status for status, _ in results)
+    print("{} requests from {} clients in {:.1f}s: {:.1f} requests/sec".format(len(results), args.clients, elapsed,
+                                                                             len(results) / elapsed))
+    print("status: " + ", ".join("{} x{}".format(status, count) for status, count in sorted(statuses.items())))
+    for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)):
+        print("{}: {:.0f} ms".format(name, 1000 * percentile(latencies, fraction)))
+    print("server: max queue depth {}, {} batches, mean batch size {:.2f}, {} rejected, {} timeouts".format(
+        metrics["max_queue_depth"], metrics["batches"], metrics["mean_batch_size"], metrics["rejected"], metrics["timeouts"]))
+
+
+if __name__ == "__main__":
+    main()
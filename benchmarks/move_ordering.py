@@ -0,0 +1,43 @@
+"""
+Compares the nodes searched and the wall time of the negamax levels with and
+without move ordering on the positions in positions.epd. Each level is searched
+to its full depth with no time or node budget so both runs do the same work.
+Run from the repository root: python -m benchmarks.move_ordering
+"""
+import time
+
+import chess.engine
+
+import chess_ai
+import move_ordering
+import search
+from benchmarks.common import load_positions
+
+
+# Returns (nodes, seconds) for searching every position to the given depth
+def run_suite(positions, depth, ordered):
+    total_nodes = 0
+    start = time.perf_counter()
+    for _, fen_board in positions:
+        if fen_board.is_game_over():
+            continue
+        searcher = search.Searcher(move_orderer=move_ordering.MoveOrderer(enabled=ordered))
+        turn = 'w' if fen_board.turn == chess.WHITE else 'b'
+        total_nodes += searcher.search(fen_board, turn, chess.engine.Limit(depth=depth)).nodes
+    return total_nodes, time.perf_counter() - start
+
+
+def main():
+    positions = load_positions()
+    print("{:<6} {:>5} {:>12} {:>12} {:>8} {:>10} {:>10} {:>8}".format(
+        "level", "depth", "nodes", "nodes (ord)", "saved", "time", "time (ord)", "saved"))
+    for level, limit in sorted(chess_ai.NEGAMAX_LIMITS.items()):
+        nodes, seconds = run_suite(positions, limit.depth, False)
+        ordered_nodes, ordered_seconds = run_suite(positions, limit.depth, True)
+        print("{:<6} {:>5} {:>12} {:>12} {:>7.1f}% {:>9.2f}s {:>9.2f}s {:>7.1f}%".format(
+            level, limit.depth, nodes, ordered_nodes, 100.0 * (1 - ordered_nodes / nodes),
+            seconds, ordered_seconds, 100.0 * (1 - ordered_seconds / seconds)))
+
+
+if __name__ == "__main__":
+    main()
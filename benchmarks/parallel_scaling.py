@@ -0,0 +1,49 @@
+"""
+Measures how the root-parallel search scales with the number of worker
+processes. Every position is searched to a fixed depth with 1, 2, 4 and 8
+workers and the wall time, nodes, nodes per second and speedup over one worker
+are reported. Run from the repository root: python -m benchmarks.parallel_scaling
+"""
+import sys
+import time
+
+import chess
+import chess.engine
+
+import parallel_search
+from benchmarks.common import load_positions
+
+WORKER_COUNTS = (1, 2, 4, 8)
+DEPTH = 3
+POSITION_COUNT = 12
+
+
+def run_suite(positions, workers):
+    searcher = parallel_search.ParallelSearcher(workers)
+    try:
+        # Start the worker processes before timing
+        searcher.search(chess.Board(), 'w', chess.engine.Limit(depth=1))
+        total_nodes = 0
+        start = time.perf_counter()
+        for _, fen_board in positions:
+            turn = 'w' if fen_board.turn == chess.WHITE else 'b'
+            total_nodes += searcher.search(fen_board, turn, chess.engine.Limit(depth=DEPTH)).nodes
+        return total_nodes, time.perf_counter() - start
+    finally:
+        searcher.close()
+
+
+def main(worker_counts=WORKER_COUNTS):
+    positions = [position for position in load_positions() if not position[1].is_game_over()][:POSITION_COUNT]
+    print("{} positions at depth {}, {} cpus".format(len(positions), DEPTH, parallel_search.DEFAULT_WORKERS))
+    print("{:>7} {:>10} {:>10} {:>10} {:>8}".format("workers", "nodes", "time", "nps", "speedup"))
+    base_seconds = None
+    for workers in worker_counts:
+        nodes, seconds = run_suite(positions, workers)
+        if base_seconds is None:
+            base_seconds = seconds
+        print("{:>7} {:>10} {:>9.2f}s {:>10.0f} {:>7.2f}x".format(workers, nodes, seconds, nodes / seconds, base_seconds / seconds))
+
+
+if __name__ == "__main__":
+    main([int(workers) for workers in sys.argv[1:]] or WORKER_COUNTS)
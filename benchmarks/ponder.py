@@ -0,0 +1,88 @@
+"""
+Measures what pondering saves. The AI plays a simulated player from positions
+in positions.epd, once without and once with pondering. The player picks its
+moves with the 1500 rating's search and takes a fixed think time per move. The
+report gives the ponder hit rate and the time the player waited for the AI's
+moves in both runs.
+Run from the repository root:
+python -m benchmarks.ponder [difficulty] [think seconds]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import chess
+
+import chess_ai
+import ponder
+import search
+from benchmarks.common import load_positions
+
+POSITIONS = 6
+AI_MOVES_PER_POSITION = 6
+THINK_TIME = 1.0
+PLAYER_LEVEL = 1500
+
+
+def turn_of(fen_board):
+    return 'w' if fen_board.turn == chess.WHITE else 'b'
+
+
+# Plays the AI against the simulated player and returns the ponderer's stats
+def run(difficulty, think_time, pondering):
+    executor = ThreadPoolExecutor(max_workers=1)
+    searcher = search.Searcher()
+    player_searcher = search.Searcher()
+
+    def think(fen_board, stop_event):
+        record = chess_ai.play_reply(difficulty, turn_of(fen_board), fen_board, searcher, stop_event) or {}
+        return (fen_board.peek() if "move" in record else None), record
+
+    ponderer = ponder.Ponderer(executor, think)
+    for _, start_board in load_positions()[:POSITIONS]:
+        fen_board = start_board.copy()
+        searcher.new_game()
+        for _ in range(AI_MOVES_PER_POSITION):
+            if fen_board.is_game_over():
+                break
+            started = time.perf_counter()
+            taken = ponderer.take(fen_board)
+            if taken:
+                future = taken[0]
+            else:
+                future = executor.submit(think, fen_board.copy(), None)
+            move, record = future.result()
+            ponderer.record_move(time.perf_counter() - started, record.get("time", 0.0), bool(taken))
+            if move is None:
+                break
+            fen_board.push(move)
+            if fen_board.is_game_over():
+                break
+            if pondering and "ponder" in record:
+                ponderer.start(fen_board, chess.Move.from_uci(record["ponder"]))
+            # The player: picks a move, then thinks until its time is up
+            thinking = time.perf_counter()
+            result = player_searcher.search(fen_board, turn_of(fen_board), chess_ai.NEGAMAX_LIMITS[PLAYER_LEVEL])
+            time.sleep(max(0.0, think_time - (time.perf_counter() - thinking)))
+            fen_board.push(result.move)
+        ponderer.stop()
+    executor.shutdown(wait=True)
+    return ponderer.stats()
+
+
+def main(difficulty=1700, think_time=THINK_TIME):
+    without = run(difficulty, think_time, False)
+    with_pondering = run(difficulty, think_time, True)
+    print("{} AI moves per run at {}, player thinking {:.1f}s per move".format(without["moves"], difficulty, think_time))
+    print("ponder hit rate: {:.0f}% ({} of {})".format(100 * with_pondering["ponder_hit_rate"], with_pondering["ponder_hits"],
+                                                    with_pondering["ponder_hits"] + with_pondering["ponder_misses"]))
+    print("mean wait without pondering: {:.0f} ms".format(1000 * without["mean_wait"]))
+    print("mean wait with pondering:    {:.0f} ms (ponder hits {:.0f} ms)".format(1000 * with_pondering["mean_wait"],
+                                                                               1000 * with_pondering["mean_hit_wait"]))
+    if without["mean_wait"]:
+        print("perceived latency reduction: {:.0f}%".format(100 * (1 - with_pondering["mean_wait"] / without["mean_wait"])))
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    main(int(arguments[0]) if arguments else 1700, float(arguments[1]) if len(arguments) > 1 else THINK_TIME)
@@ -0,0 +1,98 @@
+"""
+Measures how long the game takes to start on a hidden display. Each run is a
+fresh Python process, so nothing is cached between runs: "cold start" runs
+chess_main up to its first menu frame, "game start" starts a game against the
+AI and times its first board frame and the AI's modules finishing loading,
+then a second game in the same process.
+Run from the repository root:
+python -m benchmarks.startup [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+RUNS = 5
+# Seconds a game is left open, long enough for the AI to finish loading
+GAME_SECONDS = 1.5
+
+
+# Runs in the child process: the menu quits as soon as its first frame is shown
+def child_cold_start():
+    import pygame as p
+    import chess_main
+    flip = p.display.flip
+
+    def flip_and_quit():
+        flip()
+        p.event.post(p.event.Event(p.QUIT))
+
+    p.display.flip = flip_and_quit
+    chess_main.main(timing=True)
+
+
+# Runs in the child process: two games against the AI, each closed from a timer
+def child_game_start():
+    import pygame as p
+    import run_game
+    p.init()
+    display = p.display.set_mode((run_game.SQUARE_DIM * run_game.ROW_DIM, run_game.SQUARE_DIM * run_game.ROW_DIM))
+    games = []
+    for _ in range(2):
+        threading.Timer(GAME_SECONDS, p.event.post, (p.event.Event(p.QUIT),)).start()
+        run_game.init_game(display, p.time.Clock(), True, 1500, 'white')
+        games.append(dict(run_game.startup_times))
+    print(json.dumps(games))
+    os._exit(0) # Skip waiting on the AI worker thread
+
+
+# Starts a fresh interpreter on the child mode and returns (wall seconds, output)
+def run_child(mode):
+    environment = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child", mode], env=environment,
+                            capture_output=True, text=True, check=True).stdout
+    return time.perf_counter() - start, output
+
+
+# Reads "startup: imports 12 ms, ..." into {"imports": 12.0, ...}
+def parse_times(output):
+    times = {}
+    for line in output.splitlines():
+        if line.startswith("startup: "):
+            for part in line[len("startup: "):].split(", "):
+                name, value, _ = part.rsplit(" ", 2)
+                times[name] = float(value)
+    return times
+
+
+def report(title, samples):
+    print("{:<28}{:>8.0f} ms median {:>8.0f} ms min".format(title, statistics.median(samples), min(samples)))
+
+
+def main(runs=RUNS):
+    cold = []
+    phases = {}
+    for _ in range(runs):
+        seconds, output = run_child("cold")
+        cold.append(1000 * seconds)
+        for name, value in parse_times(output).items():
+            phases.setdefault(name, []).append(value)
+    report("cold start (process)", cold)
+    for name, samples in phases.items():
+        report("  " + name, samples)
+    games = [json.loads(run_child("game")[1]) for _ in range(runs)]
+    for number, title in ((0, "first game"), (1, "second game")):
+        for name in ("game start", "ai ready"):
+            report("{} {}".format(title, name), [1000 * game[number][name] for game in games if name in game[number]])
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    if arguments[:1] == ["--child"]:
+        child_cold_start() if arguments[1] == "cold" else child_game_start()
+    else:
+        main(int(arguments[0]) if arguments else RUNS)
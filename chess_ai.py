@@ -3,173 +3,224 @@ Generates an AI move. The AI ratings from 1500 to 1700 are played by the
 a negamax algorithim with alpha-beta pruning, while the rest of the rating ranges
 are played by the stockfish engine.
 """
+import collections
+import time
+
 import chess.engine
-import position_status
+import engine_pool
+import fast_path
+import reply_cache
+import search
+import telemetry
+from evaluation import (white_pawn_values, black_pawn_values, white_knight_values, black_knight_values,
+                        white_bishop_values, black_bishop_values, white_rook_values, black_rook_values,
+                        white_queen_values, black_queen_values, white_king_values, black_king_values)
 ROW_DIM =  8
 
-# These piece-square tables represent the positional advantages each piece
-# has at certain squares depending on their mobility and control options.
-# Values from: (https://www.chessprogramming.net/using-excel-to-help-create-piece-square-tables/)
-white_pawn_values = [
-        [0, 0, 0, 0, 0, 0, 0, 0],
-        [18, 22,  34,  50,  50,  34, 22, 18],
-        [6, 12, 25, 40, 40, 25, 12, 6],
-        [-3, 3,	17,	28,	28,	17,	3, -3],
-        [-10, -5, 10, 20, 20, 10, -5, -10],
-        [-10, -5, 5, 15, 15, 5, -5, -10],
-        [-10, -5, 5, 10, 10, 5, -5, -10],
-        [0, 0, 0, 0, 0, 0, 0, 0]
-    ]
-black_pawn_values = white_pawn_values[::-1]
-
-white_knight_values = [
-        [-60, -40, -30, -30,-30, -30, -40, -60],
-        [-40, 20, 40, 40, 40, 40, 20, -40],
-        [-40, 45, 60, 70, 70, 60, 45, -40],
-        [-40, 40, 50, 50, 50, 50, 40, -40],
-        [-40, 10, 40, 35, 35, 40, 10, -40],
-        [-40, 0, 30, 20, 20, 30, 0, -40],
-        [-55, -40, -10, 10, 10, -10, -40, -55],
-        [-70, -20, -25, -15, -15, -25, -20, -70]
-    ]
-black_knight_values = white_knight_values[::-1]
-
-white_bishop_values = [
-        [-10, -8, -6, -4, -4, -6, -8, -10],
-        [0, 20,  10,  10,  10,  10, 20, 0],
-        [10,  20,  30,  35,  35,  30,  20, 10],
-        [10,  30,  30,  35,  35,  30,  30, 10],
-        [10,  10,  25,  30,  30,  25,  10, 10],
-        [-15,  15,  25,  20,  20,  25,  15, -15],
-        [-18, 20,  15,  10,  10,  15, 20, -18],
-        [-20, -15, -10, -10, -10, -10, -15, -20]
-    ]
-black_bishop_values = white_bishop_values[::-1]
-
-white_rook_values = [
-        [-10, -8, 0, 5, 5, 0, -8, -10],
-        [0, 0, 5, 10, 10, 5, 0, 0],
-        [-10, -8, 4, 8, 8, 4, -8, -10],
-        [-10, -8, 4, 6, 6, 4, -8, -10],
-        [-10, -8, 4, 5, 5, 4, -8, -10],
-        [-10, -8, 4, 5, 5, 4, -8, -10],
-        [-10, -8, 0, 5, 5, 0, -8, -10],
-        [-10, -8, 0, 5, 5, 0, -8, -10],
-    ]
-black_rook_values = white_rook_values[::-1]
-
-white_queen_values = [
-        [0, 0, 0, 0, 0, 0, 0, 0],
-        [0, 0, 0, 0, 0, 0, 0, 0],
-        [0, 0, 0, 0, 0, 0, 0, 0],
-        [0, 0, 0, 0, 0, 0, 0, 0],
-        [0, 0, 0, 0, 0, 0, 0, 0],
-        [-10, -10, -5, 0, 0, -5, -10, -10],
-        [-20, -15,  -5,  0,  0,  -5, -15, -20],
-        [-30, -20, -10, 0, 0, -10, -20, -30]
-    ]
-black_queen_values = white_queen_values[::-1]
-
-white_king_values = [
-        [-55, -55, -60, -70, -70, -60, -55, -55],
-        [-55, -55, -60, -70, -70, -60, -55, -55],
-        [-55, -55, -60, -70, -70, -60, -55, -55],
-        [-55, -55, -60, -70, -70, -60, -55, -55],
-        [-50, -50, -55, -60, -60, -55, -50, -50],
-        [-40,  -40,  -45,  -50,  -50,  -45,  -40, -40],
-        [-30, -30,  -30,  -35,  -35,  -30, -30, -30],
-        [-3, 0, 0, -10, -10, -8, 0, -3]
-    ]
-black_king_values = white_king_values[::-1]
+
+# Per-move budget for the negamax ratings: the deepest iteration to search
+# and the time (seconds) and node limits, whichever is reached first
+NEGAMAX_LIMITS = {
+    1500: chess.engine.Limit(depth=2, time=0.25, nodes=4000),
+    1600: chess.engine.Limit(depth=3, time=0.5, nodes=20000),
+    1700: chess.engine.Limit(depth=4, time=1.0, nodes=60000),
+}
+StockfishProfile = collections.namedtuple("StockfishProfile", ["options", "limit"])
+
+# Engine options and per-move budget of the stockfish ratings. Stockfish's own
+# strength limit (UCI_Elo, which takes precedence over Skill Level) sets each
+# rating apart, and the time and node limits keep every move short whatever the
+# position. Hash and Threads here override the engine pool's defaults.
+STOCKFISH_PROFILES = {
+    1800: StockfishProfile({"UCI_LimitStrength": True, "UCI_Elo": 1800, "Hash": 16, "Threads": 1},
+                           chess.engine.Limit(time=0.1, nodes=50000)),
+    1900: StockfishProfile({"UCI_LimitStrength": True, "UCI_Elo": 1900, "Hash": 16, "Threads": 1},
+                           chess.engine.Limit(time=0.15, nodes=100000)),
+    2000: StockfishProfile({"UCI_LimitStrength": True, "UCI_Elo": 2000, "Hash": 32, "Threads": 1},
+                           chess.engine.Limit(time=0.2, nodes=200000)),
+    2100: StockfishProfile({"UCI_LimitStrength": True, "UCI_Elo": 2100, "Hash": 32, "Threads": 1},
+                           chess.engine.Limit(time=0.3, nodes=300000)),
+    2200: StockfishProfile({"UCI_LimitStrength": True, "UCI_Elo": 2200, "Hash": 64, "Threads": 1},
+                           chess.engine.Limit(time=0.4, nodes=500000)),
+}
+# Stockfish mate scores are converted to centipawns with this value
+MATE_SCORE = 100000
+# Lines Stockfish reports (MultiPV) when the reply cache wants near-equal moves.
+# The strength limit already picks its move from at least four lines, so this
+# does not change the move it plays.
+REPLY_CANDIDATES = 4
+# Seconds between checks of the stop event while Stockfish is searching
+STOP_POLL_INTERVAL = 0.005
 
 # Plays the best ai move depending on what difficulty/rating was set. The more advanced rating
-# levels use the stockfish engine.
-def ai_move(difficulty, turn, fen_board):
-    engine = chess.engine.SimpleEngine.popen_uci("./Stockfish/stockfish")
-    copied_fen_board = fen_board.copy()
-    if (fen_board.is_checkmate()):
-        return fen_board
-    if difficulty == 1500:
-        negamax(2, copied_fen_board, turn, copied_fen_board.legal_moves, 2, -9999, 9999)
-        if best_move in fen_board.legal_moves:
-            fen_board.push(best_move)
-        else: 
-            legal_moves = list(fen_board.legal_moves)
-            fen_board.push(legal_moves[0])
-    elif difficulty == 1600:
-        negamax(3, copied_fen_board, turn, copied_fen_board.legal_moves, 3, -9999, 9999)
-        if best_move in fen_board.legal_moves:
-            fen_board.push(best_move)
-        else: 
-            legal_moves = list(fen_board.legal_moves)
-            fen_board.push(legal_moves[0])
-    elif difficulty == 1700:
-        negamax(4, copied_fen_board, turn, copied_fen_board.legal_moves, 4, -9999, 9999)
-        if best_move in fen_board.legal_moves:
-            fen_board.push(best_move)
-        else: 
-            legal_moves = list(fen_board.legal_moves)
-            fen_board.push(legal_moves[0])
-    elif difficulty == 1800:
-        limit = chess.engine.Limit(depth=1)
-        result = engine.play(fen_board, limit)  
-        fen_board.push(result.move)
-    elif difficulty == 1900:
-        limit = chess.engine.Limit(depth=2)
-        result = engine.play(fen_board, limit)  
-        fen_board.push(result.move)
-    elif difficulty == 2000:
-        limit = chess.engine.Limit(depth=3)
-        result = engine.play(fen_board, limit)  
-        fen_board.push(result.move)
-    elif difficulty == 2100:
-        limit = chess.engine.Limit(depth=3)
-        result = engine.play(fen_board, limit)  
-        fen_board.push(result.move)
-    elif difficulty == 2200:
-        limit = chess.engine.Limit(depth=4)
-        result = engine.play(fen_board, limit)  
-        fen_board.push(result.move)
-    engine.quit()
+# levels use a stockfish engine leased from the shared engine pool. Passing the
+# game's searcher lets the negamax levels reuse the work of earlier moves. A
+# telemetry record of the move is emitted to the registered telemetry sinks.
+# Forced moves, dead draws and tablebase endgames are answered without a search.
+# With the reply cache turned on, a position already answered at this rating and
+# these engine settings is answered from the cache instead of searched again.
+# With the cache's variety, the search also scores the moves close to the one
+# it plays and caches them all, so later hits can pick between them.
+# Setting stop_event ends the search early with the best move found so far.
+def ai_move(difficulty, turn, fen_board, searcher=None, stop_event=None):
+    play_reply(difficulty, turn, fen_board, searcher, stop_event)
     return fen_board
 
 
-# Apply negamax algorithim recursively with alpha beta pruning to 
-# evaluate root positions for a certain depth
-def negamax(curr_depth, fen_board, turn, moves, max_depth, alpha, beta):
-    global best_move
-    board = position_status.fen_to_board(fen_board.fen())
-    if curr_depth == 0:
-        if turn == 'w':
-            return evaluate_board_score(fen_board, board, turn)
-        else: 
-            return -1 * evaluate_board_score(fen_board, board, turn)
-    max = -9999
-    if not fen_board.is_checkmate():
-        for move in moves:
-            fen_board.push(move)
-            if turn == 'b':
-                turn = 'w'
-            else: 
-                turn = 'b'
-            next_moves = fen_board.legal_moves
-            position_score = -negamax(curr_depth - 1, fen_board, turn, next_moves, max_depth, -beta, -alpha)
-            if position_score > max:
-                max = position_score
-                if curr_depth == max_depth:
-                    best_move = move
-            fen_board.pop()
-            if max > alpha:
-                alpha = max
-            if alpha >= beta:
+# Does the work of ai_move and returns the move's telemetry record (None if the
+# game is over). The record's "ponder" entry, when there is one, is the reply
+# the engine expects to its move; cached replies keep the one expected when
+# they were searched.
+def play_reply(difficulty, turn, fen_board, searcher=None, stop_event=None):
+    if (fen_board.is_checkmate()):
+        return None
+    record = {"level": difficulty, "fen": fen_board.fen()}
+    start = time.perf_counter()
+    shortcut = fast_path.find_move(fen_board)
+    if shortcut is not None:
+        move, reason = shortcut
+        fen_board.push(move)
+        record["engine"] = reason
+        record["move"] = move.uci()
+        record["time"] = time.perf_counter() - start
+        telemetry.emit(record)
+        return record
+    cache = reply_cache.get_cache()
+    settings = engine_settings(difficulty)
+    cached = None
+    variety = 0
+    if cache is not None:
+        variety = cache.variety
+        position = fen_board.copy(stack=False) # The cache is keyed by the position before the move
+        cached = cache.get(position, difficulty, settings)
+    if cached is not None:
+        fen_board.push(cached.move)
+        record["engine"] = "cache"
+        record["move"] = cached.move.uci()
+        record["score"] = cached.score
+        record["saved_time"] = cached.seconds
+        if cached.ponder is not None and fen_board.is_legal(cached.ponder):
+            record["ponder"] = cached.ponder.uci()
+        record["time"] = time.perf_counter() - start
+        telemetry.emit(record)
+        return record
+    candidates = [] # (move, score, expected reply) to cache, the played move first
+    with telemetry.profiled(record):
+        if difficulty in NEGAMAX_LIMITS:
+            if searcher is None:
+                searcher = search.Searcher()
+            result = searcher.search(fen_board, turn, NEGAMAX_LIMITS[difficulty], stop_event, root_window=variety)
+            if len(result.pv) > 1:
+                record["ponder"] = result.pv[1].uci()
+            if result.move is not None:
+                candidates = [(result.move, result.score, result.pv[1] if len(result.pv) > 1 else None)] + [
+                    (move, move_score, table_reply(searcher, fen_board, move))
+                    for move, move_score in searcher.root_candidates if move != result.move]
+                fen_board.push(result.move)
+                record["move"] = result.move.uci()
+            record["engine"] = "negamax"
+            record["score"] = result.score
+            record["pv"] = [move.uci() for move in result.pv]
+            record.update(searcher.stats())
+        elif difficulty in STOCKFISH_PROFILES:
+            profile = STOCKFISH_PROFILES[difficulty]
+            with engine_pool.get_pool().lease(options=profile.options) as engine:
+                record["lease_wait"] = engine.wait_time
+                with engine.analysis(fen_board, profile.limit, multipv=REPLY_CANDIDATES if variety else None) as analysis:
+                    info_lines = [info_record(info) for info in analysis_lines(analysis, stop_event)]
+                    best = analysis.wait()
+                    lines = [(info["pv"][0], info["score"].relative.score(mate_score=MATE_SCORE),
+                              info["pv"][1] if len(info["pv"]) > 1 else None)
+                             for info in analysis.multipv if info.get("pv") and "score" in info]
+            # The strength limit may play a weaker line than the first, so only
+            # lines scoring no better than the played one are cached with it
+            score = next((line_score for move, line_score, _ in lines if move == best.move), None)
+            if score is None and lines:
+                score = lines[0][1]
+            if score is not None:
+                candidates = [(best.move, score, best.ponder)] + [
+                    line for line in lines if line[0] != best.move and score - variety <= line[1] <= score]
+            fen_board.push(best.move)
+            record["engine"] = "stockfish"
+            record["move"] = best.move.uci()
+            if best.ponder is not None:
+                record["ponder"] = best.ponder.uci()
+            record["info"] = info_lines
+            for line in info_lines: # The last info line has the final depth and node count
+                for key in ("depth", "nodes", "nps"):
+                    if key in line:
+                        record[key] = line[key]
+    record["time"] = time.perf_counter() - start
+    record["stopped"] = stop_event is not None and stop_event.is_set()
+    # A stopped search did not get its full budget, so its move is not cached
+    if cache is not None and candidates and not record["stopped"]:
+        cache.put(position, difficulty, settings, candidates, record["time"])
+    telemetry.emit(record)
+    return record
+
+
+# The answer to move that the searcher's transposition table expects, or None
+def table_reply(searcher, fen_board, move):
+    board = fen_board.copy(stack=False)
+    board.push(move)
+    pv = searcher.principal_variation(board, 1)
+    return pv[0] if pv else None
+
+
+# Yields Stockfish's info lines until its search ends, telling it to stop as
+# soon as stop_event is set
+def analysis_lines(analysis, stop_event=None):
+    if stop_event is None:
+        for info in analysis:
+            yield info
+        return
+    while True:
+        if analysis.would_block():
+            if stop_event.wait(STOP_POLL_INTERVAL):
+                analysis.stop()
                 break
-    return max
+            continue
+        try:
+            yield analysis.get()
+        except chess.engine.AnalysisComplete:
+            return
+    for info in analysis: # The lines Stockfish sends before it answers the stop
+        yield info
+
+
+# Describes what decides a rating's moves, so cached replies are only reused
+# while the search budget or Stockfish options stay the same
+def engine_settings(difficulty):
+    if difficulty in NEGAMAX_LIMITS:
+        limit = NEGAMAX_LIMITS[difficulty]
+        return "negamax depth={} time={} nodes={}".format(limit.depth, limit.time, limit.nodes)
+    profile = STOCKFISH_PROFILES.get(difficulty)
+    if profile is None:
+        return "stockfish"
+    options = {"Hash": engine_pool.pool_settings["hash_mb"], "Threads": engine_pool.pool_settings["threads"]}
+    options.update(profile.options)
+    return "stockfish time={} nodes={} {}".format(profile.limit.time, profile.limit.nodes,
+                                                  " ".join("{}={}".format(name, options[name]) for name in sorted(options)))
+
+
+# Converts a stockfish info line into plain values for the telemetry record
+def info_record(info):
+    line = {}
+    for key, value in info.items():
+        if key == "pv":
+            line[key] = [move.uci() for move in value]
+        elif key == "score":
+            line[key] = str(value.white())
+        else:
+            line[key] = value
+    return line
 
 
 # Determines piece value based on its raw value (e.g. white pawn is always
 # worth 100 points) along with which square it is on the board (positional 
 # value). White values are positive, and black values are negative. This 
-# function returns their sum.
+# function returns their sum. The search uses evaluation.Evaluator, which
+# gives the same scores incrementally; this version is kept as its reference.
 def evaluate_board_score(fen_board, board, turn):
     white_value = 0
     black_value = 0
@@ -1,8 +1,14 @@
 """
 Generates the menu for the chess game where settings can be altered via clicking.
+Run with --timing to print how long startup and each game start took.
 """
+import sys
+import time
+STARTUP_START = time.perf_counter() # Taken before the imports so they are timed
+
 import pygame as p
 import run_game
+IMPORTS_DONE = time.perf_counter()
 
 ROW_DIM =  8
 SQUARE_DIM = 50
@@ -12,34 +18,56 @@ WHITE = (255, 255, 255)
 RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 BLACK = (0, 0, 0)
+# Set above 0 to play cached AI replies scoring within this many centipawns of
+# the best at random. Each search then scores those moves as well, which makes
+# the negamax levels search shallower in their budget.
+REPLY_VARIETY = 0
+# Set to True to let the AI think about its answer while the player is thinking
+PONDERING = False
 
 
+# Created once for the menu. Fonts are loaded once and each text is only
+# rendered the first time it is shown.
 class MenuInfo(object):
     def __init__(self, display):
         self.font = p.font.SysFont(None, 25)
+        self.banner_font = p.font.Font("freesansbold.ttf", 16)
         self.display = display
-        self.display.blit(self.font.render('click to toggle: u to undo, r to reset', True, (255, 255, 255)), (50, 365))
+        self.texts = {}
+    def render(self, text, font=None, color=WHITE, background=None):
+        key = (text, font, color, background)
+        if key not in self.texts:
+            self.texts[key] = (font or self.font).render(text, True, color, background)
+        return self.texts[key]
+    def add_help_text(self):
+        self.display.blit(self.render('click to toggle: u to undo, r to reset'), (50, 365))
     def add_rect(self, button_type):
         self.rect = p.draw.rect(self.display, (0, 0, 0), button_type)
     def add_start_text(self):
-        self.display.blit(self.font.render('START GAME', True, (255, 255, 255)), (150, 40))
+        self.display.blit(self.render('START GAME'), (150, 40))
     def add_player_mode_text(self, single_player_mode):
         if single_player_mode:
-            self.display.blit(self.font.render('Versus Chess AI', True, (255, 255, 255)), (120, 110))
+            self.display.blit(self.render('Versus Chess AI'), (120, 110))
         else:
-            self.display.blit(self.font.render('Versus Other Human', True, (255, 255, 255)), (120, 110))
+            self.display.blit(self.render('Versus Other Human'), (120, 110))
     def add_difficulty_text(self, difficulty):
-        self.display.blit(self.font.render('Computer Elo: ' + str(difficulty), True, (255, 255, 255)), (120, 180))
+        self.display.blit(self.render('Computer Elo: ' + str(difficulty)), (120, 180))
     def add_color_text(self, start_color):
-        self.display.blit(self.font.render('Play ' + start_color, True, (255, 255, 255)), (160, 250))
+        self.display.blit(self.render('Play ' + start_color), (160, 250))
     def add_exit_text(self):
-        self.display.blit(self.font.render('EXIT', True, (255, 255, 255)), (180, 320))
+        self.display.blit(self.render('EXIT'), (180, 320))
 
-# Generates the main menu display, and enables setting toggles. 
-def main():
+# Generates the main menu display, and enables setting toggles. With timing,
+# prints how long the imports, pygame and the first menu frame took, and how
+# long each game took to show its board and load the AI.
+def main(timing=False):
     p.init()
+    pygame_ready = time.perf_counter()
     display = p.display.set_mode((SQUARE_DIM * ROW_DIM, SQUARE_DIM * ROW_DIM))
     clock = p.time.Clock()
+    menu = MenuInfo(display)
+    ai_configured = False
+    first_frame = True
     run = True
     single_player_mode = False
     start_color = 'white' 
@@ -52,7 +80,7 @@ def main():
         difficulty_button = p.Rect(100, 160, 200, 50)
         color_button = p.Rect(100, 230, 200, 50)
         exit_button = p.Rect(100, 300, 200, 50)       
-        menu = MenuInfo(display)
+        menu.add_help_text()
         menu.add_rect(start_button)
         menu.add_start_text()
         menu.add_rect(player_mode_button)
@@ -64,9 +92,9 @@ def main():
         menu.add_rect(exit_button)
         menu.add_exit_text()
         if result == "mate":
-            initiate_checkmate(display)
+            initiate_checkmate(display, menu)
         elif result == "draw":
-             initiate_draw(display)
+             initiate_draw(display, menu)
         elif result == "exit": 
             run = False
         for event in p.event.get():
@@ -75,7 +103,12 @@ def main():
             elif event.type == p.MOUSEBUTTONDOWN:
                 cursor_position = p.mouse.get_pos()
                 if (start_button.collidepoint(cursor_position)):
-                    result = run_game.init_game(display, clock, single_player_mode, difficulty, start_color)
+                    if single_player_mode and not ai_configured:
+                        configure_ai()
+                        ai_configured = True
+                    result = run_game.init_game(display, clock, single_player_mode, difficulty, start_color, PONDERING)
+                    if timing:
+                        print_times("game", sorted(run_game.startup_times.items()))
                 elif (player_mode_button.collidepoint(cursor_position)):
                     if single_player_mode == True:
                         single_player_mode = False
@@ -94,23 +127,42 @@ def main():
                 elif (exit_button.collidepoint(cursor_position)):
                     run = False
         p.display.flip()
+        if first_frame:
+            first_frame = False
+            if timing:
+                now = time.perf_counter()
+                print_times("startup", [("imports", IMPORTS_DONE - STARTUP_START),
+                                        ("pygame init", pygame_ready - IMPORTS_DONE),
+                                        ("first menu frame", now - pygame_ready),
+                                        ("total", now - STARTUP_START)])
         clock.tick(60)
         p.display.update()
+    if "engine_pool" in sys.modules: # Only loaded if a game against Stockfish was played
+        sys.modules["engine_pool"].shutdown()
     p.quit()
 
 
+# Sets up what the AI modules need before the first game against the AI; they
+# are imported here rather than at startup so the menu opens sooner
+def configure_ai():
+    import reply_cache
+    reply_cache.configure(reply_cache.CACHE_PATH, variety=REPLY_VARIETY)
+
+
+def print_times(title, times):
+    print(title + ": " + ", ".join("{} {:.0f} ms".format(name, 1000 * seconds) for name, seconds in times))
+
+
 # Generate a draw display on the menu screen in case of draw
-def initiate_draw(display):
-    font = p.font.Font("freesansbold.ttf", 16)
-    text = font.render("Draw!", True, RED, BLACK)
+def initiate_draw(display, menu):
+    text = menu.render("Draw!", menu.banner_font, RED, BLACK)
     banner = text.get_rect()
-    banner.center = (SQUARE_DIM * ROW_DIM // 2, )
+    banner.center = (SQUARE_DIM * ROW_DIM // 2, 10)
     display.blit(text, banner)
 
 # Generate a checkmate display on the menu screen in case of checkmate
-def initiate_checkmate(display):
-    font = p.font.Font("freesansbold.ttf", 16)
-    text = font.render("Checkmate!", True, RED, BLACK)
+def initiate_checkmate(display, menu):
+    text = menu.render("Checkmate!", menu.banner_font, RED, BLACK)
     banner = text.get_rect()
     banner.center = (SQUARE_DIM * ROW_DIM // 2, 10)
     display.blit(text, banner)
@@ -119,4 +171,4 @@ def initiate_checkmate(display):
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main("--timing" in sys.argv[1:])
\ No newline at end of file
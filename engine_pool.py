@@ -0,0 +1,217 @@
+"""
+Keeps a pool of warm Stockfish processes that are started once and leased out
+for each AI move, so a move does not pay for process startup and NNUE loading.
+Engines are health-checked when leased and restarted if they have crashed.
+"""
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import chess.engine
+
+STOCKFISH_PATH = "./Stockfish/stockfish"
+DEFAULT_POOL_SIZE = 2
+DEFAULT_HASH_MB = 16
+DEFAULT_THREADS = 1
+# What a ping to a hung engine raises; before Python 3.11 neither timeout is the builtin TimeoutError
+PING_ERRORS = (chess.engine.EngineError, chess.engine.EngineTerminatedError, TimeoutError,
+               asyncio.TimeoutError, concurrent.futures.TimeoutError)
+
+
+# Wraps one leased engine. Every lease gets its own game token, so the engine
+# receives a ucinewgame before the first search of the lease unless the caller
+# passes the key of a game it wants to continue.
+class EngineLease(object):
+    def __init__(self, engine, game, wait_time):
+        self.engine = engine
+        self.game = game
+        self.wait_time = wait_time
+
+    def play(self, board, limit, **kwargs):
+        kwargs.setdefault("game", self.game)
+        return self.engine.play(board, limit, **kwargs)
+
+    def analysis(self, board, limit=None, **kwargs):
+        kwargs.setdefault("game", self.game)
+        return self.engine.analysis(board, limit, **kwargs)
+
+
+# A fixed number of Stockfish processes shared by every game in the process.
+# Each lease may ask for its own options (strength, Hash, ...) on top of the
+# pool's. The pool remembers what every engine was last set to and only sends
+# the options that differ, so a session at one level configures its engine
+# once; options a previous lease set that this one does not ask for go back to
+# the engine's defaults.
+class EnginePool(object):
+    def __init__(self, size=DEFAULT_POOL_SIZE, hash_mb=DEFAULT_HASH_MB, threads=DEFAULT_THREADS,
+                 path=STOCKFISH_PATH, options=None):
+        self.size = size
+        self.path = path
+        self.options = {"Hash": hash_mb, "Threads": threads}
+        if options:
+            self.options.update(options)
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.engines = []
+        self.applied = {} # Options each engine is currently set to
+        self.closed = False
+        self.leases = 0
+        self.restarts = 0
+        self.reconfigures = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+        for _ in range(size):
+            engine = self.start_engine()
+            self.engines.append(engine)
+            self.idle.put(engine)
+
+    def start_engine(self):
+        engine = chess.engine.SimpleEngine.popen_uci(self.path)
+        engine.configure(self.options)
+        self.applied[engine] = dict(self.options)
+        return engine
+
+    # Sets the engine to the pool's options plus the lease's, sending only the
+    # options that changed since the engine was last configured
+    def apply_options(self, engine, options=None):
+        wanted = dict(self.options)
+        if options:
+            wanted.update(options)
+        applied = self.applied[engine]
+        for name in applied:
+            if name not in wanted:
+                wanted[name] = engine.options[name].default
+        changed = {name: value for name, value in wanted.items() if applied.get(name) != value}
+        if changed:
+            engine.configure(changed)
+            applied.update(changed)
+            with self.lock:
+                self.reconfigures += 1
+
+    # Replaces a dead engine with a fresh process in the same pool slot
+    def restart_engine(self, engine):
+        try:
+            engine.close()
+        except Exception:
+            pass
+        self.applied.pop(engine, None)
+        new_engine = self.start_engine()
+        with self.lock:
+            self.engines[self.engines.index(engine)] = new_engine
+            self.restarts += 1
+        return new_engine
+
+    # Returns the engine, set to the options, if it answers a ping, otherwise
+    # a restarted one
+    def healthy_engine(self, engine, options=None):
+        try:
+            engine.ping()
+            self.apply_options(engine, options)
+            return engine
+        except PING_ERRORS:
+            engine = self.restart_engine(engine)
+            self.apply_options(engine, options)
+            return engine
+
+    # Leases an engine for the duration of the with-block, set to the pool's
+    # options plus the given ones. Blocks until one is idle (or timeout
+    # seconds pass) and records how long the caller waited.
+    @contextmanager
+    def lease(self, game=None, timeout=None, options=None):
+        if self.closed:
+            raise RuntimeError("engine pool is closed")
+        start = time.perf_counter()
+        try:
+            engine = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("no idle engine after {} seconds".format(timeout))
+        if self.closed: # Closed while this lease was waiting
+            self.idle.put(engine)
+            raise RuntimeError("engine pool is closed")
+        wait_time = time.perf_counter() - start
+        with self.lock:
+            self.leases += 1
+            self.total_wait += wait_time
+            self.max_wait = max(self.max_wait, wait_time)
+            self.last_wait = wait_time
+        try:
+            engine = self.healthy_engine(engine, options)
+        except Exception:
+            self.idle.put(engine)
+            raise
+        if game is None:
+            game = object()
+        try:
+            yield EngineLease(engine, game, wait_time)
+        except chess.engine.EngineTerminatedError:
+            engine = self.restart_engine(engine)
+            raise
+        finally:
+            self.idle.put(engine)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "idle": self.idle.qsize(),
+                "leases": self.leases,
+                "restarts": self.restarts,
+                "reconfigures": self.reconfigures,
+                "last_wait": self.last_wait,
+                "max_wait": self.max_wait,
+                "mean_wait": self.total_wait / self.leases if self.leases else 0.0,
+            }
+
+    # Refuses new leases, waits for every leased engine to come back and then
+    # quits them all, so an engine is never shut down in the middle of a move
+    def close(self):
+        self.closed = True
+        for _ in range(self.size):
+            engine = self.idle.get()
+            try:
+                engine.quit()
+            except Exception:
+                pass
+
+
+default_pool = None
+default_pool_lock = threading.Lock()
+pool_settings = {"size": DEFAULT_POOL_SIZE, "hash_mb": DEFAULT_HASH_MB, "threads": DEFAULT_THREADS}
+
+
+# Sets pool size and engine options. Takes effect the next time the shared pool
+# is created; an existing pool is shut down (once its leased engines are back)
+# so the new settings apply.
+def configure(size=None, hash_mb=None, threads=None):
+    global default_pool
+    with default_pool_lock:
+        if size is not None:
+            pool_settings["size"] = size
+        if hash_mb is not None:
+            pool_settings["hash_mb"] = hash_mb
+        if threads is not None:
+            pool_settings["threads"] = threads
+        pool, default_pool = default_pool, None
+    if pool is not None:
+        pool.close()
+
+
+# Returns the shared pool, starting its engines the first time it is needed
+def get_pool():
+    global default_pool
+    with default_pool_lock:
+        if default_pool is None:
+            default_pool = EnginePool(**pool_settings)
+        return default_pool
+
+
+def shutdown():
+    global default_pool
+    with default_pool_lock:
+        pool, default_pool = default_pool, None
+    if pool is not None:
+        pool.close()
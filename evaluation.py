@@ -0,0 +1,190 @@
+"""
+Scores positions for the negamax search. The piece-square tables are flattened
+into 64-entry lists indexed by chess.Square, and an Evaluator keeps the material
+plus positional score of a board up to date as moves are pushed and popped, so
+a leaf is scored without looking at the board again.
+"""
+import time
+
+import chess
+
+ROW_DIM = 8
+
+# These piece-square tables represent the positional advantages each piece
+# has at certain squares depending on their mobility and control options.
+# Values from: (https://www.chessprogramming.net/using-excel-to-help-create-piece-square-tables/)
+white_pawn_values = [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [18, 22,  34,  50,  50,  34, 22, 18],
+        [6, 12, 25, 40, 40, 25, 12, 6],
+        [-3, 3,	17,	28,	28,	17,	3, -3],
+        [-10, -5, 10, 20, 20, 10, -5, -10],
+        [-10, -5, 5, 15, 15, 5, -5, -10],
+        [-10, -5, 5, 10, 10, 5, -5, -10],
+        [0, 0, 0, 0, 0, 0, 0, 0]
+    ]
+black_pawn_values = white_pawn_values[::-1]
+
+white_knight_values = [
+        [-60, -40, -30, -30,-30, -30, -40, -60],
+        [-40, 20, 40, 40, 40, 40, 20, -40],
+        [-40, 45, 60, 70, 70, 60, 45, -40],
+        [-40, 40, 50, 50, 50, 50, 40, -40],
+        [-40, 10, 40, 35, 35, 40, 10, -40],
+        [-40, 0, 30, 20, 20, 30, 0, -40],
+        [-55, -40, -10, 10, 10, -10, -40, -55],
+        [-70, -20, -25, -15, -15, -25, -20, -70]
+    ]
+black_knight_values = white_knight_values[::-1]
+
+white_bishop_values = [
+        [-10, -8, -6, -4, -4, -6, -8, -10],
+        [0, 20,  10,  10,  10,  10, 20, 0],
+        [10,  20,  30,  35,  35,  30,  20, 10],
+        [10,  30,  30,  35,  35,  30,  30, 10],
+        [10,  10,  25,  30,  30,  25,  10, 10],
+        [-15,  15,  25,  20,  20,  25,  15, -15],
+        [-18, 20,  15,  10,  10,  15, 20, -18],
+        [-20, -15, -10, -10, -10, -10, -15, -20]
+    ]
+black_bishop_values = white_bishop_values[::-1]
+
+white_rook_values = [
+        [-10, -8, 0, 5, 5, 0, -8, -10],
+        [0, 0, 5, 10, 10, 5, 0, 0],
+        [-10, -8, 4, 8, 8, 4, -8, -10],
+        [-10, -8, 4, 6, 6, 4, -8, -10],
+        [-10, -8, 4, 5, 5, 4, -8, -10],
+        [-10, -8, 4, 5, 5, 4, -8, -10],
+        [-10, -8, 0, 5, 5, 0, -8, -10],
+        [-10, -8, 0, 5, 5, 0, -8, -10],
+    ]
+black_rook_values = white_rook_values[::-1]
+
+white_queen_values = [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [-10, -10, -5, 0, 0, -5, -10, -10],
+        [-20, -15,  -5,  0,  0,  -5, -15, -20],
+        [-30, -20, -10, 0, 0, -10, -20, -30]
+    ]
+black_queen_values = white_queen_values[::-1]
+
+white_king_values = [
+        [-55, -55, -60, -70, -70, -60, -55, -55],
+        [-55, -55, -60, -70, -70, -60, -55, -55],
+        [-55, -55, -60, -70, -70, -60, -55, -55],
+        [-55, -55, -60, -70, -70, -60, -55, -55],
+        [-50, -50, -55, -60, -60, -55, -50, -50],
+        [-40,  -40,  -45,  -50,  -50,  -45,  -40, -40],
+        [-30, -30,  -30,  -35,  -35,  -30, -30, -30],
+        [-3, 0, 0, -10, -10, -8, 0, -3]
+    ]
+black_king_values = white_king_values[::-1]
+
+PIECE_VALUES = {chess.PAWN: 100, chess.KNIGHT: 300, chess.BISHOP: 300, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 9000}
+WHITE_TABLES = {
+    chess.PAWN: white_pawn_values,
+    chess.KNIGHT: white_knight_values,
+    chess.BISHOP: white_bishop_values,
+    chess.ROOK: white_rook_values,
+    chess.QUEEN: white_queen_values,
+    chess.KING: white_king_values,
+}
+
+
+# Flattens a white table (row 0 is the 8th rank) into a list indexed by
+# chess.Square, adding the piece's raw value. Black uses the same table with
+# its rows reversed, so a black piece on a square is worth what a white piece
+# is worth on the mirrored square.
+def flatten_table(piece_type, color):
+    table = WHITE_TABLES[piece_type]
+    values = []
+    for square in chess.SQUARES:
+        if color == chess.WHITE:
+            row = ROW_DIM - 1 - chess.square_rank(square)
+        else:
+            row = chess.square_rank(square)
+        values.append(PIECE_VALUES[piece_type] + table[row][chess.square_file(square)])
+    if color == chess.BLACK:
+        values = [-value for value in values]
+    return values
+
+
+# SQUARE_SCORES[color][piece_type][square] is the signed contribution of a
+# piece to the score: positive for white and negative for black.
+SQUARE_SCORES = {
+    color: [None] + [flatten_table(piece_type, color) for piece_type in chess.PIECE_TYPES]
+    for color in chess.COLORS
+}
+
+
+# Scores a board from scratch: white's material and position minus black's
+def board_score(fen_board):
+    score = 0
+    for color in chess.COLORS:
+        tables = SQUARE_SCORES[color]
+        for piece_type in chess.PIECE_TYPES:
+            table = tables[piece_type]
+            for square in chess.scan_forward(fen_board.pieces_mask(piece_type, color)):
+                score += table[square]
+    return score
+
+
+# Returns how much the score changes when move is played on fen_board
+def move_delta(fen_board, move):
+    color = fen_board.turn
+    tables = SQUARE_SCORES[color]
+    from_square = move.from_square
+    to_square = move.to_square
+    piece_type = fen_board.piece_type_at(from_square)
+    if fen_board.is_castling(move):
+        rank = chess.square_rank(from_square)
+        if fen_board.is_kingside_castling(move):
+            king_to, rook_from, rook_to = chess.square(6, rank), chess.square(7, rank), chess.square(5, rank)
+        else:
+            king_to, rook_from, rook_to = chess.square(2, rank), chess.square(0, rank), chess.square(3, rank)
+        if fen_board.piece_type_at(to_square) == chess.ROOK:
+            rook_from = to_square # chess960 style king-takes-rook encoding
+        return (tables[chess.KING][king_to] - tables[chess.KING][from_square]
+                + tables[chess.ROOK][rook_to] - tables[chess.ROOK][rook_from])
+    if move.promotion:
+        delta = tables[move.promotion][to_square] - tables[chess.PAWN][from_square]
+    else:
+        delta = tables[piece_type][to_square] - tables[piece_type][from_square]
+    if fen_board.is_en_passant(move):
+        if color == chess.WHITE:
+            captured_square = to_square - 8
+        else:
+            captured_square = to_square + 8
+        delta -= SQUARE_SCORES[not color][chess.PAWN][captured_square]
+    else:
+        captured = fen_board.piece_type_at(to_square)
+        if captured:
+            delta -= SQUARE_SCORES[not color][captured][to_square]
+    return delta
+
+
+# Wraps a chess.Board and keeps its white-minus-black score in self.score.
+# Moves must go through push and pop so the score stays in sync. eval_time
+# adds up the time spent updating the score.
+class Evaluator(object):
+    def __init__(self, fen_board):
+        self.board = fen_board
+        self.score = board_score(fen_board)
+        self.history = []
+        self.eval_time = 0.0
+
+    def push(self, move):
+        self.history.append(self.score)
+        started = time.perf_counter()
+        self.score += move_delta(self.board, move)
+        self.eval_time += time.perf_counter() - started
+        self.board.push(move)
+
+    def pop(self):
+        self.score = self.history.pop()
+        return self.board.pop()
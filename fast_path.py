@@ -0,0 +1,120 @@
+"""
+Answers positions that need no search before the AI starts one: a move that is
+the only legal move, a position that is a dead draw, and endgames small enough
+to look up in Syzygy tablebases. The tablebase files are not part of the
+repository; put them in the tablebases folder (the 3-4-5 piece set is about
+1 GB) and positions with few enough pieces are played perfectly from them.
+"""
+import collections
+import os
+import threading
+
+import chess
+import chess.syzygy
+
+TABLEBASE_PATH = "tablebases"
+TABLEBASE_EXTENSIONS = (".rtbw", ".rtbz")
+# Ranks a tablebase result ahead of any distance to zeroing
+WDL_WEIGHT = 1000
+
+tablebases = {}
+tablebases_lock = threading.Lock()
+counts = collections.Counter()
+counts_lock = threading.Lock()
+
+
+# An opened tablebase directory and the most pieces its tables cover
+class Tablebase(object):
+    def __init__(self, path=TABLEBASE_PATH):
+        self.path = path
+        self.tablebase = chess.syzygy.Tablebase()
+        self.tables = self.tablebase.add_directory(path)
+        self.max_pieces = 0
+        for name in os.listdir(path):
+            stem, extension = os.path.splitext(name)
+            if extension in TABLEBASE_EXTENSIONS:
+                self.max_pieces = max(self.max_pieces, len(stem) - 1) # KQvK: every letter but the v is a piece
+        self.lock = threading.Lock()
+
+    def covers(self, fen_board):
+        return chess.popcount(fen_board.occupied) <= self.max_pieces and not fen_board.castling_rights
+
+    # Returns the move the tables say is best, or None if a table is missing.
+    # Wins are converted by the shortest way to the next capture or pawn move
+    # (distance to zeroing), losses are dragged out for as long as possible.
+    def best_move(self, fen_board):
+        best = None
+        board = fen_board.copy(stack=False)
+        with self.lock:
+            for move in board.legal_moves:
+                zeroing = board.is_zeroing(move)
+                board.push(move)
+                try:
+                    if board.is_checkmate():
+                        rank = WDL_WEIGHT * 3
+                    else:
+                        wdl = -self.tablebase.probe_wdl(board)
+                        dtz = -self.tablebase.probe_dtz(board)
+                        if wdl > 0:
+                            rank = WDL_WEIGHT * wdl - (0 if zeroing else abs(dtz))
+                        elif wdl < 0:
+                            rank = WDL_WEIGHT * wdl + abs(dtz)
+                        else:
+                            rank = 0
+                except (KeyError, chess.syzygy.MissingTableError):
+                    return None
+                finally:
+                    board.pop()
+                if best is None or rank > best[0]:
+                    best = (rank, move)
+        return best[1] if best else None
+
+    def close(self):
+        self.tablebase.close()
+
+
+# Returns the tablebase in path, opened the first time it is needed, or None
+# when the folder has no tables
+def get_tablebase(path=TABLEBASE_PATH):
+    with tablebases_lock:
+        if path not in tablebases:
+            tablebase = None
+            if os.path.isdir(path):
+                tablebase = Tablebase(path)
+                if not tablebase.tables:
+                    tablebase.close()
+                    tablebase = None
+            tablebases[path] = tablebase
+        return tablebases[path]
+
+
+# Returns (move, reason) when the position needs no search, else None. The
+# reason is "forced" (the only legal move), "dead draw" (neither side can
+# mate, so any move will do) or "tablebase".
+def find_move(fen_board, tablebase_path=TABLEBASE_PATH):
+    moves = list(fen_board.legal_moves)
+    if not moves:
+        return None
+    answer = None
+    if len(moves) == 1:
+        answer = (moves[0], "forced")
+    elif fen_board.is_insufficient_material():
+        answer = (moves[0], "dead draw")
+    else:
+        tablebase = get_tablebase(tablebase_path)
+        if tablebase is not None and tablebase.covers(fen_board):
+            move = tablebase.best_move(fen_board)
+            if move is not None:
+                answer = (move, "tablebase")
+    if answer is not None:
+        with counts_lock:
+            counts[answer[1]] += 1
+    return answer
+
+
+# How many positions were answered without a search, by reason
+def stats():
+    with counts_lock:
+        result = dict(counts)
+    result["total"] = sum(result.values())
+    return result
@@ -0,0 +1,219 @@
+"""
+Plays games between two AI ratings without the GUI, to measure how strong the
+levels are against each other and how fast they move. Games start from the
+opening book, are spread over a pool of worker processes and are written to a
+PGN file. Example: python match.py 1600 1800 --games 40 --workers 4
+"""
+import argparse
+import collections
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import chess
+import chess.pgn
+
+import chess_ai
+import engine_pool
+import fast_path
+import opening_book
+import reply_cache
+import search
+import telemetry
+
+MAX_PLIES = 300
+# Upper bounds (ms) of the move latency histogram buckets
+LATENCY_BUCKETS = [10, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+def player_name(level):
+    if level in chess_ai.NEGAMAX_LIMITS:
+        return "negamax {}".format(level)
+    return "stockfish {}".format(level)
+
+
+# Each worker process only needs one Stockfish at a time. With a telemetry
+# path, every worker appends its move records to that JSON lines file; with a
+# cache path, the workers share that reply cache.
+def init_worker(telemetry_path=None, cache_path=None, variety=0):
+    engine_pool.configure(size=1)
+    if telemetry_path:
+        telemetry.add_sink(telemetry.JsonlSink(telemetry_path))
+    if cache_path:
+        reply_cache.configure(cache_path, variety=variety)
+
+
+# Reply cache hits, misses and saved engine seconds of this worker so far
+def cache_counts():
+    cache = reply_cache.get_cache()
+    if cache is None:
+        return 0, 0, 0.0
+    stats = cache.stats()
+    return stats["hits"], stats["misses"], stats["saved_time"]
+
+
+# Plays one game and returns (pgn text, result, move latencies, reply cache
+# counts, moves answered without a search by reason). Latencies are (level,
+# seconds) for every move that was not taken from the book. A game still going
+# after MAX_PLIES plies is scored as a draw; a level that fails to move raises
+# RuntimeError rather than leaving the game stuck.
+def play_game(white_level, black_level, round_number, seed):
+    rng = random.Random(seed)
+    counts_before = cache_counts()
+    shortcuts_before = fast_path.stats()
+    fen_board = chess.Board()
+    book = opening_book.get_book()
+    levels = {chess.WHITE: white_level, chess.BLACK: black_level}
+    searchers = {chess.WHITE: search.Searcher(), chess.BLACK: search.Searcher()}
+    latencies = []
+    while not fen_board.is_game_over(claim_draw=True) and len(fen_board.move_stack) < MAX_PLIES:
+        level = levels[fen_board.turn]
+        move = book.choose_move(fen_board, rng)
+        if move is not None:
+            telemetry.emit({"level": level, "fen": fen_board.fen(), "engine": "book", "move": move.uci()})
+            fen_board.push(move)
+            continue
+        turn = 'w' if fen_board.turn == chess.WHITE else 'b'
+        start = time.perf_counter()
+        plies = len(fen_board.move_stack)
+        chess_ai.ai_move(level, turn, fen_board, searchers[fen_board.turn])
+        if len(fen_board.move_stack) == plies:
+            raise RuntimeError("{} did not move in {}".format(player_name(level), fen_board.fen()))
+        latencies.append((level, time.perf_counter() - start))
+    result = fen_board.result(claim_draw=True)
+    if result == "*":
+        result = "1/2-1/2"
+    game = chess.pgn.Game.from_board(fen_board)
+    game.headers["Event"] = "Practice bot match"
+    game.headers["Round"] = str(round_number)
+    game.headers["White"] = player_name(white_level)
+    game.headers["Black"] = player_name(black_level)
+    game.headers["Result"] = result
+    counts = [after - before for after, before in zip(cache_counts(), counts_before)]
+    shortcuts = {reason: count - shortcuts_before.get(reason, 0) for reason, count in fast_path.stats().items()}
+    return str(game), result, latencies, counts, shortcuts
+
+
+# Returns the Elo difference for a score fraction
+def elo_difference(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+# Returns (score, elo, elo lower bound, elo upper bound) for the first level
+# from its per-game scores (1, 0.5 or 0), using a 95% confidence interval.
+# With no games there is nothing to go on: an even score and no difference.
+def estimate_elo(scores):
+    games = len(scores)
+    if not games:
+        return 0.5, 0.0, 0.0, 0.0
+    score = sum(scores) / games
+    variance = sum((game_score - score) ** 2 for game_score in scores) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return score, elo_difference(score), elo_difference(score - margin), elo_difference(score + margin)
+
+
+def latency_histogram(latencies):
+    counts = [0] * (len(LATENCY_BUCKETS) + 1)
+    for seconds in latencies:
+        milliseconds = seconds * 1000
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and milliseconds >= LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        counts[bucket] += 1
+    return counts
+
+
+def print_latencies(level, latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        print("{}: no moves outside the book".format(player_name(level)))
+        return
+    print("{}: {} moves, mean {:.0f} ms, p50 {:.0f} ms, p99 {:.0f} ms, max {:.0f} ms".format(
+        player_name(level), len(latencies), 1000 * sum(latencies) / len(latencies),
+        1000 * latencies[len(latencies) // 2], 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        1000 * latencies[-1]))
+    counts = latency_histogram(latencies)
+    labels = ["< {} ms".format(bound) for bound in LATENCY_BUCKETS] + [">= {} ms".format(LATENCY_BUCKETS[-1])]
+    widest = max(counts)
+    for label, count in zip(labels, counts):
+        if count:
+            print("  {:>10} {:>6} {}".format(label, count, "#" * max(1, 40 * count // widest)))
+
+
+# Plays the match and returns the per-game scores of level_a
+def run_match(level_a, level_b, games, workers, pgn_path, seed, telemetry_path=None, cache_path=None, variety=0):
+    scores = []
+    latencies = {level_a: [], level_b: []}
+    cache_hits, cache_misses, saved_time = 0, 0, 0.0
+    shortcuts = collections.Counter()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(telemetry_path, cache_path, variety)) as executor, open(pgn_path, "w") as pgn_file:
+        futures = {}
+        for game_number in range(games):
+            # Alternate colors so neither level always has the first move
+            if game_number % 2 == 0:
+                white_level, black_level = level_a, level_b
+            else:
+                white_level, black_level = level_b, level_a
+            future = executor.submit(play_game, white_level, black_level, game_number + 1, seed + game_number)
+            futures[future] = game_number % 2 == 0 # Whether level_a has White
+        for future in as_completed(futures):
+            pgn, result, game_latencies, (hits, misses, seconds), game_shortcuts = future.result()
+            shortcuts.update(game_shortcuts)
+            cache_hits += hits
+            cache_misses += misses
+            saved_time += seconds
+            pgn_file.write(pgn + "\n\n")
+            white_score = {"1-0": 1.0, "0-1": 0.0}.get(result, 0.5)
+            if futures[future]:
+                scores.append(white_score)
+            else:
+                scores.append(1 - white_score)
+            for level, seconds in game_latencies:
+                latencies[level].append(seconds)
+            print("game {}/{}: {}".format(len(scores), games, result))
+    elapsed = time.perf_counter() - start
+    wins = scores.count(1.0)
+    draws = scores.count(0.5)
+    score, elo, elo_low, elo_high = estimate_elo(scores)
+    print("")
+    print("{} vs {}: +{} ={} -{} ({:.1f}%)".format(player_name(level_a), player_name(level_b), wins, draws,
+                                                   len(scores) - wins - draws, 100 * score))
+    print("elo difference: {:+.0f} (95% interval {:+.0f} to {:+.0f})".format(elo, elo_low, elo_high))
+    print("{} games in {:.1f}s ({:.3f} games/sec)".format(len(scores), elapsed, len(scores) / elapsed))
+    for level in sorted(latencies):
+        print_latencies(level, latencies[level])
+    print("moves without a search: {} ({})".format(shortcuts["total"], ", ".join(
+        "{} {}".format(reason, count) for reason, count in sorted(shortcuts.items()) if reason != "total" and count) or "none"))
+    if cache_path:
+        lookups = cache_hits + cache_misses
+        print("reply cache: {} hits of {} lookups ({:.1f}%), {:.1f}s of engine time saved".format(
+            cache_hits, lookups, 100.0 * cache_hits / lookups if lookups else 0.0, saved_time))
+    return scores
+
+
+def main():
+    levels = sorted(chess_ai.NEGAMAX_LIMITS) + sorted(chess_ai.STOCKFISH_PROFILES)
+    parser = argparse.ArgumentParser(description="Play AI levels against each other without the GUI.")
+    parser.add_argument("level_a", type=int, choices=levels, help="rating of the first player, e.g. 1600")
+    parser.add_argument("level_b", type=int, choices=levels, help="rating of the second player, e.g. 1800")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--pgn", default="match.pgn", help="file the games are written to")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the opening book choices")
+    parser.add_argument("--telemetry", help="JSON lines file for per-move telemetry records")
+    parser.add_argument("--reply-cache", help="SQLite file of cached AI replies to use and fill")
+    parser.add_argument("--variety", type=int, default=0,
+                        help="play a random cached reply within this many centipawns of the best")
+    args = parser.parse_args()
+    if args.games < 1:
+        parser.error("--games must be at least 1")
+    run_match(args.level_a, args.level_b, args.games, args.workers, args.pgn, args.seed, args.telemetry,
+              args.reply_cache, args.variety)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Orders moves for the negamax search so alpha-beta pruning cuts off early: the
+transposition table move first, then captures by most valuable victim / least
+valuable attacker, promotions, killer moves and finally quiet moves by their
+history score.
+"""
+import chess
+
+from evaluation import PIECE_VALUES
+
+MAX_PLY = 128
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+PROMOTION_SCORE = 90000
+KILLER_SCORES = (80000, 79000)
+# History scores are halved once they reach this so they stay below the killers
+HISTORY_LIMIT = 50000
+
+
+# Keeps the killer moves (quiet moves that caused a beta cutoff) of every ply
+# and the history score of every quiet from-to pair for each color. With
+# enabled=False moves are searched in the order they are generated.
+class MoveOrderer(object):
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.clear()
+
+    def clear(self):
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [[0] * 4096, [0] * 4096]
+
+    # Called before every search. Killers belong to the previous position's
+    # plies, while history is kept but weighted down.
+    def new_search(self):
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        for table in self.history:
+            for index in range(4096):
+                table[index] //= 2
+
+    def score(self, fen_board, move, hash_move, killers, history):
+        if move == hash_move:
+            return HASH_MOVE_SCORE
+        victim = fen_board.piece_type_at(move.to_square)
+        if victim is None and fen_board.is_en_passant(move):
+            victim = chess.PAWN
+        if victim is not None:
+            attacker = fen_board.piece_type_at(move.from_square)
+            return CAPTURE_SCORE + 10 * PIECE_VALUES[victim] - PIECE_VALUES[attacker]
+        if move.promotion:
+            return PROMOTION_SCORE + PIECE_VALUES[move.promotion]
+        if move == killers[0]:
+            return KILLER_SCORES[0]
+        if move == killers[1]:
+            return KILLER_SCORES[1]
+        return history[move.from_square * 64 + move.to_square]
+
+    # Returns the moves as a list, best candidates first
+    def order(self, fen_board, moves, hash_move, ply):
+        if not self.enabled:
+            return list(moves)
+        killers = self.killers[min(ply, MAX_PLY - 1)]
+        history = self.history[fen_board.turn]
+        return sorted(moves, key=lambda move: self.score(fen_board, move, hash_move, killers, history), reverse=True)
+
+    # Records a quiet move that caused a beta cutoff at the given ply and depth
+    def record_cutoff(self, fen_board, move, ply, depth):
+        if not self.enabled or fen_board.is_capture(move) or move.promotion:
+            return
+        killers = self.killers[min(ply, MAX_PLY - 1)]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        history = self.history[fen_board.turn]
+        index = move.from_square * 64 + move.to_square
+        history[index] += depth * depth
+        if history[index] > HISTORY_LIMIT:
+            for square_pair in range(4096):
+                history[square_pair] //= 2
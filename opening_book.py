@@ -0,0 +1,119 @@
+"""
+Reads the polyglot opening book. The book file is memory-mapped once per
+process (the operating system shares the mapped pages between processes) and
+indexed by position key, so a probe is a dictionary lookup instead of a file
+open and binary search. Recent probe results are kept in a small LRU cache.
+"""
+import collections
+import mmap
+import random
+import struct
+import threading
+
+import chess
+import chess.polyglot
+
+BOOK_PATH = "openings/baron30.bin"
+ENTRY_FORMAT = struct.Struct(">QHHI")
+CACHE_SIZE = 4096
+
+# Polyglot writes castling as the king taking its own rook
+CASTLING_MOVES = {
+    (chess.E1, chess.H1): chess.G1,
+    (chess.E1, chess.A1): chess.C1,
+    (chess.E8, chess.H8): chess.G8,
+    (chess.E8, chess.A8): chess.C8,
+}
+
+
+# A memory-mapped polyglot book with an in-memory index from position key to
+# the first of that position's entries. Safe to share between threads.
+class OpeningBook(object):
+    def __init__(self, path=BOOK_PATH, cache_size=CACHE_SIZE):
+        self.path = path
+        with open(path, "rb") as book_file:
+            self.data = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.data) // ENTRY_FORMAT.size
+        self.index = {}
+        previous_key = None
+        for position, (key, _, _, _) in enumerate(ENTRY_FORMAT.iter_unpack(self.data[:self.size * ENTRY_FORMAT.size])):
+            if key != previous_key:
+                self.index[key] = position
+                previous_key = key
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Decodes a raw polyglot move for the position on fen_board
+    def decode_move(self, fen_board, raw_move):
+        to_square = raw_move & 0x3f
+        from_square = (raw_move >> 6) & 0x3f
+        promotion_part = (raw_move >> 12) & 0x7
+        promotion = promotion_part + 1 if promotion_part else None
+        if fen_board.piece_type_at(from_square) == chess.KING and (from_square, to_square) in CASTLING_MOVES:
+            to_square = CASTLING_MOVES[(from_square, to_square)]
+        return chess.Move(from_square, to_square, promotion)
+
+    def read_entries(self, fen_board, key):
+        entries = []
+        position = self.index.get(key)
+        if position is None:
+            return entries
+        while position < self.size:
+            entry_key, raw_move, weight, learn = ENTRY_FORMAT.unpack_from(self.data, position * ENTRY_FORMAT.size)
+            if entry_key != key:
+                break
+            move = self.decode_move(fen_board, raw_move)
+            if weight > 0 and fen_board.is_legal(move):
+                entries.append(chess.polyglot.Entry(key, raw_move, weight, learn, move))
+            position += 1
+        return entries
+
+    # Returns the book entries (chess.polyglot.Entry) for the position
+    def entries(self, fen_board):
+        key = chess.polyglot.zobrist_hash(fen_board)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+        entries = self.read_entries(fen_board, key)
+        with self.lock:
+            self.misses += 1
+            self.cache[key] = entries
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return entries
+
+    # Same as chess.polyglot reader.get: the entry with the highest weight, or None
+    def get(self, fen_board):
+        entries = self.entries(fen_board)
+        if not entries:
+            return None
+        return max(entries, key=lambda entry: entry.weight)
+
+    # Picks a book move at random in proportion to the entries' weights, or
+    # returns None once the position is out of the book
+    def choose_move(self, fen_board, rng=random):
+        entries = self.entries(fen_board)
+        if not entries:
+            return None
+        return rng.choices(entries, weights=[entry.weight for entry in entries])[0].move
+
+    def stats(self):
+        with self.lock:
+            return {"entries": self.size, "positions": len(self.index), "cache_hits": self.hits, "cache_misses": self.misses}
+
+
+books = {}
+books_lock = threading.Lock()
+
+
+# Returns the book for path, loading it the first time it is asked for
+def get_book(path=BOOK_PATH):
+    with books_lock:
+        if path not in books:
+            books[path] = OpeningBook(path)
+        return books[path]
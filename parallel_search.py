@@ -0,0 +1,165 @@
+"""
+Root-parallel version of the negamax search. The root moves are dealt out to a
+pool of worker processes, each searches its share with its own Searcher, and
+the best of their results is played. A ParallelSearcher can be passed to
+chess_ai.ai_move wherever a Searcher is accepted.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import chess
+import chess.engine
+
+import move_ordering
+import search
+
+DEFAULT_WORKERS = multiprocessing.cpu_count()
+# Seconds between checks of a search's stop event while the workers search
+STOP_POLL_INTERVAL = 0.01
+
+# Set in every worker process by init_worker. ParallelSearcher.stop() sets it
+# to end the searches running in the workers.
+worker_stop_event = None
+
+
+def init_worker(stop_event):
+    global worker_stop_event
+    worker_stop_event = stop_event
+
+
+# Runs in a worker: searches the given root moves and returns every completed
+# iteration as (depth, move, score, pv) with the moves in uci notation, plus
+# the number of nodes searched. The position is fen with the played moves
+# replayed on it, so the search sees the positions it may not repeat.
+def search_root_moves(fen, played, turn, limit, root_moves):
+    fen_board = chess.Board(fen)
+    for move in played:
+        fen_board.push_uci(move)
+    searcher = search.Searcher()
+    moves = [chess.Move.from_uci(move) for move in root_moves]
+    searcher.search(fen_board, turn, limit, stop_event=worker_stop_event, root_moves=moves)
+    iterations = []
+    for depth, result in searcher.iterations:
+        iterations.append((depth, result.move.uci(), result.score, [move.uci() for move in result.pv]))
+    return iterations, searcher.nodes
+
+
+# Returns the position before the last capture or pawn move (as a FEN) and the
+# moves played since, which is all search.earlier_positions looks at
+def recent_moves(fen_board):
+    board = fen_board.copy()
+    played = []
+    for _ in range(min(board.halfmove_clock, len(board.move_stack))):
+        played.append(board.pop().uci())
+    return board.fen(), played[::-1]
+
+
+# Picks the result to play from every worker's iterations. Scores are only
+# compared at a depth every worker completed; a worker that found a forced mate
+# (and so stopped deepening) counts as having completed every depth, and its
+# mate is always a candidate even when it is deeper than that depth.
+def combine_results(worker_iterations):
+    finished = [iterations for iterations in worker_iterations if iterations]
+    if not finished:
+        return None
+    common_depth = search.MAX_DEPTH
+    for iterations in finished:
+        depth, _, score, _ = iterations[-1]
+        if abs(score) < 9999:
+            common_depth = min(common_depth, depth)
+    best = None
+    for iterations in finished:
+        if abs(iterations[-1][2]) >= 9999:
+            candidate = iterations[-1]
+        else:
+            candidates = [iteration for iteration in iterations if iteration[0] <= common_depth]
+            if not candidates:
+                continue
+            candidate = candidates[-1]
+        if best is None or candidate[2] > best[2]:
+            best = candidate
+    return best
+
+
+# Splits the root moves over a pool of worker processes. The root moves are
+# ordered first (captures, promotions) and dealt out round-robin so every worker
+# gets a mix of promising and quiet moves. Each worker gets the whole time
+# budget but a share of the node budget, so a node-limited level searches the
+# same number of nodes in total.
+class ParallelSearcher(object):
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.workers = workers
+        self.stop_event = multiprocessing.Event()
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(self.stop_event,))
+        self.nodes = 0
+        self.depth = 0
+        self.result = None
+        self.root_candidates = []
+
+    # Workers start every search with fresh tables, so there is nothing to forget
+    def new_game(self):
+        pass
+
+    def stop(self):
+        self.stop_event.set()
+
+    # Like Searcher.search: setting stop_event stops the workers at their next
+    # check. root_window is accepted for the same calls, but only the best move
+    # is left in root_candidates.
+    def search(self, fen_board, turn, limit, stop_event=None, root_window=0):
+        self.stop_event.clear()
+        self.root_candidates = []
+        moves = move_ordering.MoveOrderer().order(fen_board, fen_board.legal_moves, None, 0)
+        self.nodes = 0
+        self.depth = 0
+        self.result = search.SearchResult(None, 0, [], 0)
+        if not moves:
+            return self.result
+        worker_count = min(self.workers, len(moves))
+        shares = [[move.uci() for move in moves[index::worker_count]] for index in range(worker_count)]
+        worker_limit = limit
+        if limit.nodes is not None:
+            worker_limit = chess.engine.Limit(depth=limit.depth, time=limit.time, nodes=max(1, limit.nodes // worker_count))
+        fen, played = recent_moves(fen_board)
+        futures = [self.executor.submit(search_root_moves, fen, played, turn, worker_limit, share) for share in shares]
+        running = set(futures)
+        while running and stop_event is not None:
+            _, running = wait(running, timeout=STOP_POLL_INTERVAL)
+            if stop_event.is_set():
+                self.stop()
+                break
+        worker_iterations = []
+        for future in futures:
+            iterations, nodes = future.result()
+            worker_iterations.append(iterations)
+            self.nodes += nodes
+        best = combine_results(worker_iterations)
+        if best is not None:
+            depth, move, score, pv = best
+            self.depth = depth
+            self.result = search.SearchResult(chess.Move.from_uci(move), score, [chess.Move.from_uci(move) for move in pv], self.nodes)
+            self.root_candidates = [(self.result.move, score)]
+        else:
+            self.result = self.result._replace(nodes=self.nodes)
+        return self.result
+
+    # Statistics of the last search. The workers' table and ordering counters
+    # stay in the worker processes, so only depth and nodes are reported.
+    def stats(self):
+        return {"depth": self.depth, "nodes": self.nodes, "workers": self.workers}
+
+    # Runs search on a thread so the event loop is not blocked. Cancelling
+    # the returned coroutine stops the workers at their next check.
+    async def search_async(self, fen_board, turn, limit, executor=None):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, self.search, fen_board.copy(), turn, limit)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            self.stop()
+            raise
+
+    def close(self):
+        self.stop()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,97 @@
+"""
+Lets the AI think on the player's time. After the AI moves, it starts working
+out its answer to the reply it expects (the second move of its principal
+variation, or Stockfish's ponder move) on the AI worker thread. If the player
+plays that move, the AI's answer is already done or on its way; otherwise the
+pondering search is stopped and the real one starts. Pondering runs the same
+search the AI would run anyway, so it changes how soon the AI answers, not how
+well it plays.
+"""
+import threading
+
+
+# Identifies a position by move count and fen
+def position_key(fen_board):
+    return len(fen_board.move_stack), fen_board.fen()
+
+
+# Runs think(fen_board, stop_event) on the executor for the position after the
+# predicted reply and hands the pending result over when the prediction comes
+# true. Counts hits and misses, and the time the player waited for each AI move
+# against the time the AI's search took.
+class Ponderer(object):
+    def __init__(self, executor, think):
+        self.executor = executor
+        self.think = think
+        self.pondering = None # (future, position key, stop event)
+        self.hits = 0
+        self.misses = 0
+        self.moves = 0
+        self.hit_moves = 0
+        self.wait_time = 0.0
+        self.search_time = 0.0
+        self.hit_wait_time = 0.0
+        self.hit_search_time = 0.0
+
+    # Starts pondering on fen_board (the position the player is to move in)
+    # followed by predicted_move
+    def start(self, fen_board, predicted_move):
+        self.stop()
+        if predicted_move is None or not fen_board.is_legal(predicted_move):
+            return
+        ponder_board = fen_board.copy()
+        ponder_board.push(predicted_move)
+        if ponder_board.is_game_over():
+            return
+        stop_event = threading.Event()
+        future = self.executor.submit(self.think, ponder_board.copy(), stop_event)
+        self.pondering = (future, position_key(ponder_board), stop_event)
+
+    # Called when it is the AI's turn on fen_board. On a ponder hit returns the
+    # pondering (future, stop event), which keeps searching until its budget is
+    # used. On a miss stops the pondering search and returns None.
+    def take(self, fen_board):
+        if self.pondering is None:
+            return None
+        future, key, stop_event = self.pondering
+        self.pondering = None
+        if key == position_key(fen_board) and not future.cancelled():
+            self.hits += 1
+            return future, stop_event
+        self.misses += 1
+        stop_event.set()
+        future.cancel()
+        return None
+
+    # Stops pondering without counting a hit or miss (undo, reset, quit)
+    def stop(self):
+        if self.pondering is not None:
+            future, _, stop_event = self.pondering
+            stop_event.set()
+            future.cancel()
+            self.pondering = None
+
+    # Records an AI move: how long the player waited for it and how long its
+    # search took, and whether it came from a ponder hit
+    def record_move(self, wait_time, search_time, hit):
+        self.moves += 1
+        self.wait_time += wait_time
+        self.search_time += search_time
+        if hit:
+            self.hit_moves += 1
+            self.hit_wait_time += wait_time
+            self.hit_search_time += search_time
+
+    # The hit rate, and the share of search time the player did not wait for
+    def stats(self):
+        predictions = self.hits + self.misses
+        return {
+            "ponder_hits": self.hits,
+            "ponder_misses": self.misses,
+            "ponder_hit_rate": self.hits / predictions if predictions else 0.0,
+            "moves": self.moves,
+            "mean_wait": self.wait_time / self.moves if self.moves else 0.0,
+            "mean_hit_wait": self.hit_wait_time / self.hit_moves if self.hit_moves else 0.0,
+            "mean_search_time": self.search_time / self.moves if self.moves else 0.0,
+            "latency_reduction": 1 - self.wait_time / self.search_time if self.search_time else 0.0,
+        }
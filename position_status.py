@@ -4,14 +4,63 @@ it is, and the board represented by the current fen.
 """
 import chess
 
-# Holds a 2d board array representing the position, and the turn
-class PositionStatus:
-    def __init__(self, fen):
-        self.board = fen_to_board(fen)
-        if "w" in fen:
-            self.turn = "w"
-        else: 
-            self.turn = "b"
+# Square codes: 0 is an empty square, 1-6 white pieces and 7-12 black pieces,
+# in python-chess piece type order (pawn, knight, bishop, rook, queen, king)
+EMPTY = 0
+BLACK_OFFSET = 6
+# The tag of each square code, as used by the images and the 2d board
+TAGS = ('e', 'wp', 'wn', 'wb', 'wr', 'wq', 'wk', 'bp', 'bn', 'bb', 'br', 'bq', 'bk')
+FEN_CODES = dict([(chess.piece_symbol(piece_type).upper(), piece_type) for piece_type in chess.PIECE_TYPES] +
+                 [(chess.piece_symbol(piece_type), piece_type + BLACK_OFFSET) for piece_type in chess.PIECE_TYPES])
+
+
+# Holds the position as 64 square codes, row by row from the 8th rank (the
+# same order the window draws it in), and the side to move ('w' or 'b').
+# Build it with from_board to skip the fen text entirely.
+class PositionStatus(object):
+    __slots__ = ("squares", "turn")
+
+    def __init__(self, fen=None):
+        self.squares = bytearray(64)
+        self.turn = "w"
+        if fen is not None:
+            fields = fen.split(" ")
+            if len(fields) > 1 and fields[1] == "b":
+                self.turn = "b"
+            index = 0
+            for char in fields[0]:
+                if char in '12345678':
+                    index += int(char)
+                elif char != '/':
+                    self.squares[index] = FEN_CODES[char]
+                    index += 1
+
+    # Builds the position straight from a chess.Board's piece bitboards
+    @classmethod
+    def from_board(cls, fen_board):
+        ps = cls()
+        squares = ps.squares
+        for color, offset in ((chess.WHITE, 0), (chess.BLACK, BLACK_OFFSET)):
+            for piece_type in chess.PIECE_TYPES:
+                for square in chess.scan_forward(fen_board.pieces_mask(piece_type, color)):
+                    squares[square ^ 56] = piece_type + offset # Flips the rank so row 0 is the 8th rank
+        ps.turn = "w" if fen_board.turn == chess.WHITE else "b"
+        return ps
+
+    # Returns the tag of the piece on column x and row y (from the 8th rank), or 'e'
+    def piece_at(self, x, y):
+        return TAGS[self.squares[y * 8 + x]]
+
+    # Yields (x, y, tag) for every occupied square
+    def pieces(self):
+        for index, code in enumerate(self.squares):
+            if code:
+                yield index % 8, index // 8, TAGS[code]
+
+    # The position as the 2d array fen_to_board returns
+    @property
+    def board(self):
+        return [[TAGS[code] for code in self.squares[row * 8:row * 8 + 8]] for row in range(8)]
 
 
 # Parses fen to a board that is a 2d array where 'e' denotes an empty square,
@@ -32,4 +81,3 @@ def fen_to_board(fen):
                 curr_row.append('w' + char.lower())
         board.append(curr_row)
     return board
-
@@ -0,0 +1,191 @@
+"""
+Remembers the AI's replies so a position seen before at the same rating and
+engine settings is answered without searching again. Recent replies are kept
+in an in-memory LRU cache in front of a SQLite file that is shared by every
+game, process and session. Each reply is stored with its score for the side to
+move, the engine time it took (which is what a cache hit saves) and the answer
+the engine expected to it, so the AI can ponder after a cached move too.
+"""
+import collections
+import os
+import random
+import sqlite3
+import threading
+
+import chess.polyglot
+
+CACHE_PATH = "reply_cache.sqlite3"
+MEMORY_SIZE = 4096
+# Seconds a process waits for another process's write to finish
+BUSY_TIMEOUT = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replies (
+    key INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    settings TEXT NOT NULL,
+    move TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    ponder TEXT,
+    PRIMARY KEY (key, level, settings, move)
+)
+"""
+
+CachedReply = collections.namedtuple("CachedReply", ["move", "score", "seconds", "ponder"])
+
+
+# Zobrist keys are unsigned 64 bit, SQLite integers are signed
+def signed_key(fen_board):
+    key = chess.polyglot.zobrist_hash(fen_board)
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+# Replies cached per (position key, rating, engine settings). A search stores
+# every root move it scored within variety centipawns of the move it played,
+# so with variety the cache can choose between those near-equal moves. Safe to
+# share between threads; other processes open the same file with their own cache.
+class ReplyCache(object):
+    def __init__(self, path=CACHE_PATH, memory_size=MEMORY_SIZE, variety=0):
+        self.path = path
+        self.memory_size = memory_size
+        self.variety = variety
+        self.memory = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.connection_pid = None
+        self.hits = 0
+        self.misses = 0
+        self.saved_time = 0.0
+
+    # Opens the database the first time it is used in this process. A
+    # connection is never shared with a forked child, which opens its own.
+    def database(self):
+        if self.connection is None or self.connection_pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            # Write-ahead logging lets readers in other processes carry on during a write
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(SCHEMA)
+            self.add_ponder_column()
+            self.connection.commit()
+            self.connection_pid = os.getpid()
+        return self.connection
+
+    # Files written before replies kept their expected answer lack the ponder
+    # column. Another process may add it at the same moment, which is fine.
+    def add_ponder_column(self):
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(replies)")]
+        if "ponder" not in columns:
+            try:
+                self.connection.execute("ALTER TABLE replies ADD COLUMN ponder TEXT")
+            except sqlite3.OperationalError:
+                pass
+
+    # Returns the cached replies for the position, best score first
+    def replies(self, fen_board, level, settings):
+        cache_key = (signed_key(fen_board), level, settings)
+        with self.lock:
+            if cache_key in self.memory:
+                self.memory.move_to_end(cache_key)
+                return self.memory[cache_key]
+            rows = self.database().execute(
+                "SELECT move, score, seconds, ponder FROM replies WHERE key = ? AND level = ? AND settings = ? ORDER BY score DESC",
+                cache_key).fetchall()
+            replies = [CachedReply(chess.Move.from_uci(move), score, seconds, chess.Move.from_uci(ponder) if ponder else None)
+                       for move, score, seconds, ponder in rows]
+            self.remember(cache_key, replies)
+            return replies
+
+    def remember(self, cache_key, replies):
+        self.memory[cache_key] = replies
+        self.memory.move_to_end(cache_key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    # Returns a cached legal reply for the position, or None. The best cached
+    # reply is returned unless variety allows a random near-equal one.
+    def get(self, fen_board, level, settings, rng=random):
+        replies = [reply for reply in self.replies(fen_board, level, settings) if fen_board.is_legal(reply.move)]
+        if not replies:
+            with self.lock:
+                self.misses += 1
+            return None
+        candidates = [reply for reply in replies if reply.score >= replies[0].score - self.variety]
+        reply = rng.choice(candidates)
+        with self.lock:
+            self.hits += 1
+            self.saved_time += reply.seconds
+        return reply
+
+    # Stores the replies one search found for the position: (move, score,
+    # expected answer or None) with scores for the side to move, and the seconds
+    # the engine spent
+    def put(self, fen_board, level, settings, scored_moves, seconds):
+        cache_key = (signed_key(fen_board), level, settings)
+        new_replies = [CachedReply(move, score, seconds, ponder) for move, score, ponder in scored_moves]
+        with self.lock:
+            connection = self.database()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO replies (key, level, settings, move, score, seconds, ponder) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [cache_key + (reply.move.uci(), reply.score, seconds, reply.ponder.uci() if reply.ponder else None)
+                     for reply in new_replies])
+            if cache_key in self.memory:
+                moves = set(reply.move for reply in new_replies)
+                replies = [cached for cached in self.memory[cache_key] if cached.move not in moves] + new_replies
+                replies.sort(key=lambda cached: cached.score, reverse=True)
+                self.remember(cache_key, replies)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            connection = self.database()
+            with connection:
+                connection.execute("DELETE FROM replies")
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_time": self.saved_time,
+                "memory_entries": len(self.memory),
+            }
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.connection_pid == os.getpid():
+                self.connection.close()
+            self.connection = None
+
+
+default_cache = None
+default_cache_lock = threading.Lock()
+cache_settings = {"path": None, "memory_size": MEMORY_SIZE, "variety": 0}
+
+
+# Turns the shared reply cache on (with the file it is stored in) or off (with
+# path None). variety is the score window, in centipawns, for choosing between
+# cached replies.
+def configure(path=CACHE_PATH, memory_size=None, variety=None):
+    global default_cache
+    cache_settings["path"] = path
+    if memory_size is not None:
+        cache_settings["memory_size"] = memory_size
+    if variety is not None:
+        cache_settings["variety"] = variety
+    with default_cache_lock:
+        if default_cache is not None:
+            default_cache.close()
+            default_cache = None
+
+
+# Returns the shared cache, or None if caching is off (the default)
+def get_cache():
+    global default_cache
+    with default_cache_lock:
+        if default_cache is None and cache_settings["path"] is not None:
+            default_cache = ReplyCache(**cache_settings)
+        return default_cache
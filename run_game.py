@@ -4,11 +4,13 @@ positions are represented with FEN: a notation describing where all the pieces
 are. The init_game function also handles all the settings chosen in the menu.
 # Each '/' in the FEN seperates the next row starting from the 8th rank
 """
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import chess
-import chess.engine
-import chess.polyglot
 import pygame as p
-import position_status, chess_ai
+import position_status, telemetry, ponder
 
 
 ROW_DIM =  8
@@ -19,89 +21,245 @@ RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 BLACK = (0, 0, 0)
 PIECES = {}
+SURFACES = {}
+FONTS = {}
+# Seconds from the start of the last game to its first frame ("game start")
+# and to the AI being loaded ("ai ready"), for the startup timing report
+startup_times = {}
+# Longest wait (ms) for input when there is nothing to redraw
+IDLE_TIMEOUT = 1000
 # IMAGE_TAGS: first letter represents piece color, second letter represents piece initial letter (with n for knight)
 IMAGE_TAGS = ['bb', 'bk', 'bn', 'bq', 'br', 'bp', 'wb', 'wk', 'wn', 'wp', 'wq', 'wr']
 
 
-# Load chess piece pngs into the PIECES dictionary where each tag ('bb', etc) corresponds to a piece png
+# Load chess piece pngs into the PIECES dictionary where each tag ('bb', etc) corresponds to a piece png.
+# The pieces are only loaded and scaled once per run.
 def load_chess_pngs(): 
+    if PIECES:
+        return
     for tag in IMAGE_TAGS:
         PIECES[tag] = p.transform.scale(p.image.load("images/" + tag + ".png"), (SQUARE_DIM, SQUARE_DIM))
 
 
-# Initialize chess game
-def init_game(display, clock, single_player_mode, difficulty, start_color):
+# Initialize chess game. The AI's moves are worked out on a background thread
+# while the window keeps drawing and handling input; the pending move is
+# polled every frame and thrown away if the position changed in the meantime.
+# The board and pieces are rendered into a scene surface only when the position
+# changes. Each frame only the squares under the hover/drag highlights are
+# redrawn and updated, and with nothing going on the loop waits for input.
+# With pondering, the AI works out its answer to the move it expects from the
+# player while the player is thinking. The AI's modules are loaded on the AI
+# worker when the first game against it starts, while the board is drawn.
+def init_game(display, clock, single_player_mode, difficulty, start_color, pondering=False):
+    game_start = time.perf_counter()
+    startup_times.clear()
     p.display.set_caption("My Board")
     load_chess_pngs()
+    font = get_font(22)
+    searcher_future = None # The AI's searcher for this game, which keeps its search tables
+    if single_player_mode:
+        searcher_future = ai_executor.submit(load_ai, game_start)
     fen_board = chess.Board() # Initialize the starting board and tracks fen
     fen = fen_board.fen()
+    ps = position_status.PositionStatus.from_board(fen_board)
     piece_selection = False
     run = True
     drag = False
+    pending = None # (future, position key, stop event, start time, ponder hit) of the AI move being worked out
+    ponderer = None
+    if pondering and single_player_mode:
+        ponderer = ponder.Ponderer(ai_executor, lambda ponder_board, stop_event: find_ai_move(
+            difficulty, 'w' if ponder_board.turn == chess.WHITE else 'b', ponder_board, searcher_future, stop_event))
+    scene_fen = None # Position the scene surface was rendered for
+    overlay = None # What is drawn over the scene, to tell when it must change
+    overlay_rects = []
     while run:
-        ps = position_status.PositionStatus(fen)
-        board = ps.board
-        x, y, piece = square_under_mouse(fen, board)
+        x, y, piece = square_under_mouse(ps)
         your_turn = human_turn(ps.turn, single_player_mode, start_color)
-        if your_turn: # Human decided move
-            for event in p.event.get(): # Process user interaction with the gui
-                if event.type == p.QUIT:
-                    run = False
-                if event.type == p.KEYDOWN:
-                    if event.key == p.K_u and fen_board.move_stack: # undo move
-                        if single_player_mode:
-                            fen_board.pop()
-                            fen_board.pop()
-                        else: 
-                            fen_board.pop()
-                        fen = refresh_board(display, fen_board)
-                    if event.key == p.K_r and fen_board.move_stack: # reset game
-                        fen_board.reset()
-                        fen = refresh_board(display, fen_board)
-                if event.type == p.MOUSEBUTTONDOWN: # Checks the piece clicked
-                    drag = True
-                    if piece != 'e': 
-                        piece_selection = True
-                        start_coord = chess_notation_converter(x, y, piece)
-                    chosen_piece = piece
-                    start_x, start_y = x, y
-                if event.type == p.MOUSEBUTTONUP: # Checks validity of drop square for piece
-                    if piece_selection: 
-                        end_x, end_y, _ = square_under_mouse(fen, board)
-                        end_coord = chess_notation_converter(end_x, end_y, chosen_piece)
-                        if start_coord != end_coord:
-                            move = chess.Move.from_uci(start_coord + end_coord) 
-                            if (fen_board.is_legal(move)):
-                                fen_board.push(move)
-                                fen = refresh_board(display, fen_board)
-                        piece_selection = False 
-                        drag = False 
-        else: # AI determined move
-            with chess.polyglot.open_reader("openings/baron30.bin") as reader:
-                entry = reader.get(fen_board)
-                if entry == None: # Triggers if no more opening theory is left
-                    fen_board = chess_ai.ai_move(difficulty, ps.turn, fen_board)
+        for event in p.event.get(): # Process user interaction with the gui
+            if event.type == p.QUIT:
+                run = False
+            if event.type == p.KEYDOWN:
+                if event.key == p.K_u and fen_board.move_stack: # undo move
+                    if ponderer:
+                        ponderer.stop()
+                    if pending: # The AI has not answered yet, so only take back the human's move
+                        pending = cancel_ai_move(pending)
+                        fen_board.pop()
+                    elif single_player_mode:
+                        fen_board.pop()
+                        fen_board.pop()
+                    else: 
+                        fen_board.pop()
                     fen = refresh_board(display, fen_board)
-                else: # Opening move
-                    move = chess.Move.from_uci(str(entry.move)) 
+                if event.key == p.K_r and fen_board.move_stack: # reset game
+                    pending = cancel_ai_move(pending)
+                    if ponderer:
+                        ponderer.stop()
+                    fen_board.reset()
+                    if searcher_future: # On the AI worker, after any search still finishing
+                        ai_executor.submit(lambda: searcher_future.result().new_game())
+                    fen = refresh_board(display, fen_board)
+            if not your_turn:
+                continue
+            if event.type == p.MOUSEBUTTONDOWN: # Checks the piece clicked
+                drag = True
+                if piece != 'e': 
+                    piece_selection = True
+                    start_coord = chess_notation_converter(x, y, piece)
+                chosen_piece = piece
+                start_x, start_y = x, y
+            if event.type == p.MOUSEBUTTONUP: # Checks validity of drop square for piece
+                if piece_selection: 
+                    end_x, end_y, _ = square_under_mouse(ps)
+                    end_coord = chess_notation_converter(end_x, end_y, chosen_piece)
+                    if start_coord != end_coord:
+                        move = chess.Move.from_uci(start_coord + end_coord) 
+                        if (fen_board.is_legal(move)):
+                            fen_board.push(move)
+                            fen = refresh_board(display, fen_board)
+                    piece_selection = False 
+                    drag = False 
+        if not run:
+            cancel_ai_move(pending)
+            stop_pondering(ponderer)
+            break
+        if not your_turn: # AI determined move
+            if pending is None:
+                taken = ponderer.take(fen_board) if ponderer else None
+                if taken: # The player made the expected move, so the answer is already being worked out
+                    future, stop_event = taken
+                else:
+                    stop_event = threading.Event()
+                    future = ai_executor.submit(find_ai_move, difficulty, ps.turn, fen_board.copy(), searcher_future, stop_event)
+                pending = (future, ponder.position_key(fen_board), stop_event, time.perf_counter(), bool(taken))
+            elif pending[0].done():
+                future, key, _, started, hit = pending
+                pending = None
+                move, record = future.result()
+                if move is not None and key == ponder.position_key(fen_board): # Otherwise the result is stale
                     fen_board.push(move)
                     fen = refresh_board(display, fen_board)
-        create_board(display)
-        fen_to_pieces(fen, display)
+                    if ponderer:
+                        ponderer.record_move(time.perf_counter() - started, record.get("time", 0.0), hit)
+                        if "ponder" in record:
+                            ponderer.start(fen_board, chess.Move.from_uci(record["ponder"]))
+        full_update = False
+        if fen != scene_fen: # The position changed: check for the end and redraw everything
+            if (fen_board.is_stalemate() or fen_board.can_claim_draw()):
+                stop_pondering(ponderer)
+                return "draw"
+            if (fen_board.is_checkmate()):
+                stop_pondering(ponderer)
+                return "mate"
+            ps = position_status.PositionStatus.from_board(fen_board)
+            scene = render_scene(ps)
+            scene_fen = fen
+            display.blit(scene, (0, 0))
+            overlay_rects = []
+            full_update = True
         if drag:
-            animate_piece_drag(display, fen, ps, chosen_piece, start_x, start_y) 
-        else: 
-            select_square(display, x, y)
-        if (fen_board.is_stalemate() or fen_board.can_claim_draw()):
-            return "draw"
-        if (fen_board.is_checkmate()):
-            return "mate"
-        p.display.flip()
+            new_overlay = ('drag', x, y, start_x, start_y, chosen_piece)
+        else:
+            new_overlay = ('hover', x, y)
+        if pending:
+            new_overlay += (p.time.get_ticks() // 300 % 4,)
+        if full_update or new_overlay != overlay:
+            dirty_rects = overlay_rects
+            for rect in overlay_rects: # Restore the scene under the previous highlights
+                display.blit(scene, rect, rect)
+            if drag:
+                animate_piece_drag(display, ps, chosen_piece, start_x, start_y) 
+                overlay_rects = [square_rect(start_x, start_y), square_rect(x, y)]
+            else: 
+                select_square(display, x, y)
+                overlay_rects = [square_rect(x, y)]
+            if pending:
+                overlay_rects.append(draw_thinking(display, font, new_overlay[-1]))
+            overlay = new_overlay
+            if full_update:
+                p.display.update()
+                startup_times.setdefault("game start", time.perf_counter() - game_start)
+            else:
+                p.display.update(dirty_rects + overlay_rects)
+        elif not pending and not p.event.peek(): # Nothing to do until the next input
+            event = p.event.wait(IDLE_TIMEOUT)
+            if event.type != p.NOEVENT:
+                p.event.post(event)
         clock.tick(60)
-        p.display.update()
     return "exit"
 
 
+# Worker thread that works out the AI's moves, one at a time
+ai_executor = ThreadPoolExecutor(max_workers=1)
+
+
+# Runs on the AI worker: imports the engine modules, opens the opening book
+# (cheap after the first game) and returns the game's searcher, so neither the
+# first board frame nor the AI's first move waits for them
+def load_ai(game_start):
+    import chess_ai, opening_book, search
+    opening_book.get_book()
+    searcher = search.Searcher()
+    startup_times["ai ready"] = time.perf_counter() - game_start
+    return searcher
+
+
+# Returns the default font at the given size, created once per run
+def get_font(size):
+    if size not in FONTS:
+        FONTS[size] = p.font.SysFont(None, size)
+    return FONTS[size]
+
+
+# Runs on the AI worker: returns the AI's move for the board (a copy of the
+# game's board), taken from the opening book while it still has the position,
+# and the move's telemetry record. Setting stop_event ends the search early.
+# After a book move the expected reply is the book's main move in answer.
+# searcher_future is the load_ai future that holds the game's searcher.
+def find_ai_move(difficulty, turn, fen_board, searcher_future, stop_event=None):
+    import chess_ai, opening_book
+    book = opening_book.get_book()
+    move = book.choose_move(fen_board)
+    if move != None:
+        record = {"level": difficulty, "fen": fen_board.fen(), "engine": "book", "move": move.uci()}
+        board = fen_board.copy(stack=False)
+        board.push(move)
+        reply = book.get(board)
+        if reply is not None:
+            record["ponder"] = reply.move.uci()
+        telemetry.emit(record)
+    else: # Triggers if no more opening theory is left
+        played = len(fen_board.move_stack)
+        record = chess_ai.play_reply(difficulty, turn, fen_board, searcher_future.result(), stop_event) or {}
+        if len(fen_board.move_stack) > played:
+            move = fen_board.peek()
+    return move, record
+
+
+# Stops the pending AI move (if any) and returns None to clear it
+def cancel_ai_move(pending):
+    if pending:
+        pending[2].set()
+        pending[0].cancel()
+    return None
+
+
+# Stops the AI thinking on the player's time at the end of a game and reports
+# how well it predicted the player's moves
+def stop_pondering(ponderer):
+    if ponderer:
+        ponderer.stop()
+        if ponderer.moves:
+            telemetry.emit(dict(ponderer.stats(), event="pondering"))
+
+
+# Shows that the AI is working out its move and returns the area drawn on
+def draw_thinking(display, font, dots):
+    text = font.render('thinking' + '.' * dots, True, WHITE, BLACK)
+    return display.blit(text, (SQUARE_DIM * ROW_DIM - 90, SQUARE_DIM * ROW_DIM - 20))
+
+
 # Returns true if it is a human's to move, and false if it is the computer's 
 def human_turn(turn, single_player_mode, start_color):
     if single_player_mode:
@@ -109,6 +267,25 @@ def human_turn(turn, single_player_mode, start_color):
     else: 
         return True
 
+# Returns the empty board, drawn the first time it is needed
+def board_surface():
+    if 'board' not in SURFACES:
+        SURFACES['board'] = p.Surface((SQUARE_DIM * ROW_DIM, SQUARE_DIM * ROW_DIM)).convert()
+        create_board(SURFACES['board'])
+    return SURFACES['board']
+
+
+# Draws the board with the position's pieces on it into a new surface
+def render_scene(ps):
+    scene = board_surface().copy()
+    draw_pieces(ps, scene)
+    return scene
+
+
+def square_rect(x, y):
+    return p.Rect(x * SQUARE_DIM, y * SQUARE_DIM, SQUARE_DIM, SQUARE_DIM)
+
+
 # Generates the board display (white and blue checkered squares)
 def create_board(display):
     count = 0
@@ -123,39 +300,23 @@ def create_board(display):
     p.draw.rect(display, BLACK, (0, 0, SQUARE_DIM * ROW_DIM, SQUARE_DIM * ROW_DIM), 2)
 
 
-# Uses the position's fen to draw the pieces in the correct locations.
-def fen_to_pieces(fen, display):
-    curr_row = 0
-    for row in fen.split('/'):
-        column = 0
-        for char in row:
-            if char == ' ':
-                break
-            elif char in '12345678':
-                column += int(char)
-            elif char > 'Z':
-                tag = 'b' + char
-                display.blit(PIECES[tag], p.Rect(column * SQUARE_DIM, curr_row * SQUARE_DIM, SQUARE_DIM, SQUARE_DIM))
-                column += 1
-            else:
-                tag = 'w' + char.lower()
-                display.blit(PIECES[tag], p.Rect(column * SQUARE_DIM, curr_row * SQUARE_DIM, SQUARE_DIM, SQUARE_DIM))
-                column += 1
-        curr_row += 1
+# Draws the position's pieces in the correct locations.
+def draw_pieces(ps, display):
+    for column, row, tag in ps.pieces():
+        display.blit(PIECES[tag], (column * SQUARE_DIM, row * SQUARE_DIM))
 
-# Given some change to the board and its fen, refresh the gui of the board
+# Given some change to the board, returns its new fen. The game loop redraws
+# the board on the next frame because the fen changed.
 def refresh_board(display, fen_board):
-    fen = fen_board.fen()
-    fen_to_pieces(fen, display) #!!! RETURN FEN
-    return fen 
+    return fen_board.fen()
 
 # Returns the column (x) and row (y) of the mouse location, and the piece 
 # if one is there. 
-def square_under_mouse(fen, board):
+def square_under_mouse(ps):
     cursor_position = p.mouse.get_pos()
     x = cursor_position[0] // SQUARE_DIM
     y = cursor_position[1] // SQUARE_DIM
-    piece = board[y][x]
+    piece = ps.piece_at(x, y)
     return x, y, piece
 
 # Given the numerical x, y coordinates (ranging from 0-7), return the chess 
@@ -176,8 +337,8 @@ def select_square(display, x, y):
     p.draw.rect(display, RED, (x * SQUARE_DIM, y * SQUARE_DIM, SQUARE_DIM, SQUARE_DIM), 2)
 
 # Handles the piece dragging animation.
-def animate_piece_drag(display, fen, ps, chosen_piece, start_x, start_y):
-    x, y, _ = square_under_mouse(fen, ps.board)
+def animate_piece_drag(display, ps, chosen_piece, start_x, start_y):
+    x, y, _ = square_under_mouse(ps)
     if (chosen_piece[0] == ps.turn):
         p.draw.rect(display, (194, 197, 204), (start_x * SQUARE_DIM, start_y * SQUARE_DIM, SQUARE_DIM, SQUARE_DIM))
         display.blit(PIECES[chosen_piece], (p.Rect(x * SQUARE_DIM, y * SQUARE_DIM, SQUARE_DIM, SQUARE_DIM)))
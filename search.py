@@ -0,0 +1,362 @@
+"""
+The negamax search behind the AI ratings from 1500 to 1700. A Searcher owns its
+transposition table, move ordering statistics and counters, so several games
+can search at the same time in one process, each with its own Searcher.
+"""
+import asyncio
+import collections
+import threading
+import time
+
+import chess
+
+import evaluation
+import move_ordering
+import transposition_table as tt
+
+MAX_DEPTH = 64
+# Most quiescence nodes searched below a single leaf of the negamax search
+QUIESCENCE_NODE_LIMIT = 2000
+QUIESCENCE_MAX_PLY = 8
+# A capture is skipped in quiescence when even winning the captured piece plus
+# this margin cannot raise the score to alpha
+DELTA_MARGIN = 200
+
+SearchResult = collections.namedtuple("SearchResult", ["move", "score", "pv", "nodes"])
+
+
+# Raised inside the search when its time or node budget runs out or it is stopped
+class SearchAborted(Exception):
+    pass
+
+
+# Searches positions with iterative deepening negamax. The transposition table
+# and move ordering statistics are kept between searches, so one Searcher per
+# game lets each move reuse the work of the previous one. A Searcher runs one
+# search at a time; stop() may be called from any thread to end the running
+# search early.
+class Searcher(object):
+    def __init__(self, table_size_mb=tt.DEFAULT_SIZE_MB, move_orderer=None):
+        self.transposition_table = tt.TranspositionTable(table_size_mb)
+        if move_orderer is None:
+            move_orderer = move_ordering.MoveOrderer()
+        self.move_orderer = move_orderer
+        self.stop_event = threading.Event()
+        self.depth = 0
+        self.node_limit = None
+        self.deadline = None
+        self.root_best_move = None
+        self.root_window = 0
+        self.root_scores = []
+        self.root_candidates = []
+        self.result = None
+        self.iterations = []
+        self.evaluator = None
+        self.repetitions = {}
+        self.reset_counters()
+
+    # Per-search statistics, reported by stats()
+    def reset_counters(self):
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.leaf_quiescence_start = 0
+        self.interior_nodes = 0
+        self.cutoffs = 0
+        self.movegen_time = 0.0
+        self.search_time = 0.0
+        self.table_probes_start = self.table_probes()
+
+    # Forgets the stored positions and move ordering statistics of the previous game
+    def new_game(self):
+        self.transposition_table.clear()
+        self.move_orderer.clear()
+
+    def stop(self):
+        self.stop_event.set()
+
+    # Searches depth 1, 2, ... until the limit's depth is done or its time/node
+    # budget runs out, and returns the result of the last completed iteration.
+    # Each iteration leaves its best moves in the transposition table, which the
+    # move orderer puts first, so the previous principal variation is searched
+    # first. The budget is only enforced once the first iteration has finished,
+    # so there is always a move to play unless the search was stopped. With
+    # root_moves only those moves are searched at the root. With a root_window
+    # (centipawns), root moves scoring within that much of the best get exact
+    # scores too, at the cost of a wider search; they are left in
+    # root_candidates as (move, score), best first.
+    def search(self, fen_board, turn, limit, stop_event=None, root_moves=None, root_window=0):
+        if stop_event is None:
+            stop_event = threading.Event()
+        self.stop_event = stop_event
+        self.transposition_table.new_search()
+        self.move_orderer.new_search()
+        evaluator = evaluation.Evaluator(fen_board.copy())
+        start = time.perf_counter()
+        self.reset_counters()
+        self.evaluator = evaluator
+        self.depth = 0
+        self.node_limit = None
+        self.deadline = None
+        self.result = SearchResult(None, 0, [], 0)
+        self.iterations = []
+        self.root_window = root_window
+        self.root_candidates = []
+        max_depth = limit.depth or MAX_DEPTH
+        if root_moves is None:
+            root_moves = evaluator.board.legal_moves
+        game_keys = earlier_positions(evaluator.board)
+        for depth in range(1, max_depth + 1):
+            self.repetitions = dict(game_keys)
+            try:
+                score = self.negamax(depth, evaluator, turn, root_moves, depth, -9999, 9999)
+            except SearchAborted:
+                while evaluator.history:
+                    evaluator.pop()
+                break
+            if self.root_best_move is None:
+                break
+            self.depth = depth
+            self.result = SearchResult(self.root_best_move, score, self.principal_variation(evaluator.board, depth), self.nodes)
+            self.iterations.append((depth, self.result))
+            self.root_candidates = sorted([(move, move_score) for move, move_score in self.root_scores
+                                           if move_score >= score - root_window], key=lambda candidate: -candidate[1])
+            elapsed = time.perf_counter() - start
+            # Stop at a forced mate, or when the next (larger) iteration is unlikely to finish
+            if abs(score) >= 9999 or (limit.time is not None and elapsed * 2 > limit.time):
+                break
+            if limit.nodes is not None and self.nodes * 2 > limit.nodes:
+                break
+            self.node_limit = limit.nodes
+            if limit.time is not None:
+                self.deadline = start + limit.time
+        self.result = self.result._replace(nodes=self.nodes)
+        self.search_time = time.perf_counter() - start
+        return self.result
+
+    # Hits, misses and collisions of the transposition table so far
+    def table_probes(self):
+        table = self.transposition_table
+        return table.hits, table.misses, table.collisions
+
+    # Statistics of the last search. Move generation time covers generating
+    # and ordering moves and the checkmate tests; evaluation time covers the
+    # evaluator's incremental score updates.
+    def stats(self):
+        hits, misses, collisions = [now - before for now, before in zip(self.table_probes(), self.table_probes_start)]
+        probes = hits + misses + collisions
+        eval_time = 0.0
+        if self.evaluator is not None:
+            eval_time = self.evaluator.eval_time
+        return {
+            "depth": self.depth,
+            "nodes": self.nodes,
+            "quiescence_nodes": self.quiescence_nodes,
+            "nps": round(self.nodes / self.search_time) if self.search_time else 0,
+            "search_time": self.search_time,
+            "tt_hit_rate": hits / probes if probes else 0.0,
+            "cutoff_rate": self.cutoffs / self.interior_nodes if self.interior_nodes else 0.0,
+            "movegen_time": self.movegen_time,
+            "eval_time": eval_time,
+        }
+
+    # Runs search on a worker thread so the event loop is not blocked.
+    # Cancelling the returned coroutine stops the search at its next node.
+    async def search_async(self, fen_board, turn, limit, executor=None):
+        loop = asyncio.get_running_loop()
+        stop_event = threading.Event()
+        future = loop.run_in_executor(executor, self.search, fen_board.copy(), turn, limit, stop_event)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            stop_event.set()
+            raise
+
+    # Follows the transposition table's best moves from the root
+    def principal_variation(self, fen_board, depth):
+        board = fen_board.copy(stack=False)
+        pv = []
+        seen = set()
+        while len(pv) < depth:
+            key = tt.position_key(board)
+            entry = self.transposition_table.peek(key)
+            if entry is None or key in seen:
+                break
+            move = entry[3]
+            if move is None or not board.is_legal(move):
+                break
+            seen.add(key)
+            pv.append(move)
+            board.push(move)
+        return pv
+
+    def check_limits(self):
+        if self.stop_event.is_set():
+            raise SearchAborted()
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchAborted()
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchAborted()
+
+    # Apply negamax algorithim recursively with alpha beta pruning to
+    # evaluate root positions for a certain depth. Results are stored in the
+    # transposition table together with whether they are exact scores or bounds.
+    # The evaluator tracks the board's score as moves are made, so leaves are
+    # scored without re-reading the board.
+    def negamax(self, curr_depth, evaluator, turn, moves, max_depth, alpha, beta):
+        self.nodes += 1
+        if self.nodes % 64 == 0 or self.node_limit is not None:
+            self.check_limits()
+        if curr_depth == max_depth:
+            self.root_best_move = None
+            self.root_scores = []
+        fen_board = evaluator.board
+        started = time.perf_counter()
+        mated = fen_board.is_checkmate()
+        self.movegen_time += time.perf_counter() - started
+        if mated:
+            return -9999
+        if curr_depth == 0:
+            return self.quiescence(evaluator, turn, alpha, beta, max_depth, 0)
+        transposition_table = self.transposition_table
+        key = tt.position_key(fen_board)
+        # A position already on the path or played earlier in the game is scored
+        # as the draw that repeating it leads to
+        if curr_depth != max_depth and key in self.repetitions:
+            return 0
+        entry = transposition_table.probe(key)
+        hash_move = None
+        if entry is not None:
+            hash_move = entry[3]
+        if entry is not None and entry[0] >= curr_depth and curr_depth != max_depth:
+            _, score, bound, _ = entry
+            if bound == tt.EXACT:
+                return score
+            if bound == tt.LOWER and score >= beta:
+                return score
+            if bound == tt.UPPER and score <= alpha:
+                return score
+        original_alpha = alpha
+        if turn == 'b':
+            next_turn = 'w'
+        else:
+            next_turn = 'b'
+        max = -9999
+        node_best_move = None
+        searched = False
+        ply = max_depth - curr_depth
+        started = time.perf_counter()
+        ordered_moves = self.move_orderer.order(fen_board, moves, hash_move, ply)
+        self.movegen_time += time.perf_counter() - started
+        self.interior_nodes += 1
+        repetitions = self.repetitions
+        repetitions[key] = repetitions.get(key, 0) + 1
+        for move in ordered_moves:
+            searched = True
+            evaluator.push(move)
+            next_moves = fen_board.legal_moves
+            position_score = -self.negamax(curr_depth - 1, evaluator, next_turn, next_moves, max_depth, -beta, -alpha)
+            evaluator.pop()
+            # A root score above alpha is exact, one at or below it only a bound
+            if curr_depth == max_depth and alpha < position_score < beta:
+                self.root_scores.append((move, position_score))
+            if position_score > max or node_best_move is None:
+                max = position_score
+                node_best_move = move
+                if curr_depth == max_depth:
+                    self.root_best_move = move
+            if max > alpha:
+                alpha = max
+                if curr_depth == max_depth and self.root_window:
+                    alpha = max - self.root_window # Moves close to the best still get exact scores
+            if alpha >= beta:
+                self.cutoffs += 1
+                self.move_orderer.record_cutoff(fen_board, move, ply, curr_depth)
+                break
+        if repetitions[key] == 1:
+            del repetitions[key]
+        else:
+            repetitions[key] -= 1
+        if not searched: # Stalemate, checkmate was handled above
+            return 0
+        if max <= original_alpha:
+            bound = tt.UPPER
+        elif max >= beta:
+            bound = tt.LOWER
+        else:
+            bound = tt.EXACT
+        transposition_table.store(key, curr_depth, max, bound, node_best_move)
+        return max
+
+    # Extends a leaf of the negamax search with captures (and checks on its first
+    # ply) until the position is quiet, so the score is not taken halfway through
+    # an exchange. The side to move may stand pat on the static score unless it is
+    # in check, in which case every evasion is searched. Each leaf may use up to
+    # QUIESCENCE_NODE_LIMIT nodes, after which the rest of its tree stands pat.
+    def quiescence(self, evaluator, turn, alpha, beta, ply, quiescence_ply):
+        self.nodes += 1
+        if self.nodes % 64 == 0 or self.node_limit is not None:
+            self.check_limits()
+        self.quiescence_nodes += 1
+        if quiescence_ply == 0:
+            self.leaf_quiescence_start = self.quiescence_nodes
+        fen_board = evaluator.board
+        if turn == 'w':
+            stand_pat = evaluator.score
+        else:
+            stand_pat = -1 * evaluator.score
+        if self.quiescence_nodes - self.leaf_quiescence_start >= QUIESCENCE_NODE_LIMIT or quiescence_ply >= QUIESCENCE_MAX_PLY:
+            return stand_pat
+        started = time.perf_counter()
+        in_check = fen_board.is_check()
+        if in_check:
+            moves = list(fen_board.legal_moves)
+            if not moves:
+                return -9999
+            max = -9999
+        else:
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = list(fen_board.generate_legal_captures())
+            for move in fen_board.generate_legal_moves():
+                if move.promotion and not fen_board.is_capture(move):
+                    moves.append(move)
+                elif quiescence_ply == 0 and not fen_board.is_capture(move) and fen_board.gives_check(move):
+                    moves.append(move)
+            max = stand_pat
+        moves = self.move_orderer.order(fen_board, moves, None, ply)
+        self.movegen_time += time.perf_counter() - started
+        if turn == 'b':
+            next_turn = 'w'
+        else:
+            next_turn = 'b'
+        for move in moves:
+            if not in_check and not move.promotion:
+                captured = fen_board.piece_type_at(move.to_square)
+                if captured is None and fen_board.is_en_passant(move):
+                    captured = chess.PAWN
+                if captured is not None and stand_pat + evaluation.PIECE_VALUES[captured] + DELTA_MARGIN < alpha:
+                    continue
+            evaluator.push(move)
+            position_score = -self.quiescence(evaluator, next_turn, -beta, -alpha, ply + 1, quiescence_ply + 1)
+            evaluator.pop()
+            if position_score > max:
+                max = position_score
+            if max > alpha:
+                alpha = max
+            if alpha >= beta:
+                break
+        return max
+
+
+# Counts the position keys since the last capture or pawn move before the
+# board's current position, which a search must not repeat
+def earlier_positions(fen_board):
+    board = fen_board.copy()
+    keys = {}
+    for _ in range(min(board.halfmove_clock, len(board.move_stack))):
+        board.pop()
+        key = tt.position_key(board)
+        keys[key] = keys.get(key, 0) + 1
+    return keys
@@ -0,0 +1,340 @@
+"""
+Serves AI moves over HTTP and WebSocket, so many lightweight clients can share
+one bot instead of each running the pygame window. A request gives a position
+(FEN plus the moves played from it), a rating and optionally a deadline, and
+gets back the AI's move. Requests wait in a bounded queue and each goes to the
+next free worker process; identical requests waiting together are batched into
+one search. Each worker keeps its own searcher and a warm Stockfish engine and
+answers from the opening book first.
+Run from the repository root: python server.py --port 8080 --workers 2
+
+POST /move  {"fen": "...", "moves": ["e2e4"], "level": 1600, "deadline_ms": 3000}
+GET  /ws    WebSocket; each text message is a request like the above plus an
+            optional "id", answered with a message carrying the same id
+GET  /metrics  queue depth, batches, rejections, timeouts and latencies
+"""
+import argparse
+import asyncio
+import collections
+import math
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+from aiohttp import web, WSMsgType
+
+import chess_ai
+import engine_pool
+import opening_book
+import search
+
+DEFAULT_WORKERS = 2
+MAX_QUEUE = 256
+DEFAULT_DEADLINE = 5.0
+MAX_DEADLINE = 30.0
+# Extra seconds allowed for a worker's answer to arrive after the deadline
+DEADLINE_GRACE = 0.25
+LATENCY_SAMPLES = 1000
+
+# Set in every worker process by init_worker
+worker_searcher = None
+
+
+class RequestError(Exception):
+    pass
+
+
+# Each worker process keeps one Stockfish and one searcher for all its requests
+def init_worker():
+    global worker_searcher
+    engine_pool.configure(size=1)
+    worker_searcher = search.Searcher()
+
+
+# Checks a request's fields and returns (fen, moves, level, seconds to deadline)
+def parse_request(data):
+    if not isinstance(data, dict):
+        raise RequestError("request must be a JSON object")
+    level = data.get("level")
+    if level not in chess_ai.NEGAMAX_LIMITS and level not in chess_ai.STOCKFISH_PROFILES:
+        raise RequestError("unknown level {!r}".format(level))
+    fen = data.get("fen", chess.STARTING_FEN)
+    moves = data.get("moves", [])
+    if not isinstance(fen, str):
+        raise RequestError("fen must be a string")
+    if not isinstance(moves, list) or not all(isinstance(move, str) for move in moves):
+        raise RequestError("moves must be a list of uci strings")
+    try:
+        fen_board = chess.Board(fen)
+        # An illegal position (say the side not to move in check) can crash or hang Stockfish
+        if not fen_board.is_valid():
+            raise RequestError("illegal position")
+        for move in moves:
+            fen_board.push_uci(move)
+    except (AttributeError, TypeError, ValueError) as error:
+        raise RequestError("bad position: {}".format(error))
+    if fen_board.is_game_over():
+        raise RequestError("the game is over")
+    try:
+        deadline = float(data.get("deadline_ms", DEFAULT_DEADLINE * 1000)) / 1000
+    except (TypeError, ValueError):
+        raise RequestError("deadline_ms must be a number")
+    if not math.isfinite(deadline) or deadline <= 0:
+        raise RequestError("deadline_ms must be a positive number")
+    deadline = min(deadline, MAX_DEADLINE)
+    return fen, list(moves), level, deadline
+
+
+# Runs in a worker: answers one request, stopping the search at the deadline
+# (a wall clock time) with the best move found by then
+def answer(fen, moves, level, deadline):
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return {"error": "deadline"}
+    fen_board = chess.Board(fen)
+    for move in moves:
+        fen_board.push_uci(move)
+    move = opening_book.get_book().choose_move(fen_board)
+    if move is not None:
+        return {"move": move.uci(), "engine": "book"}
+    stop_event = threading.Event()
+    timer = threading.Timer(remaining, stop_event.set)
+    timer.start()
+    try:
+        turn = 'w' if fen_board.turn == chess.WHITE else 'b'
+        record = chess_ai.play_reply(level, turn, fen_board, worker_searcher, stop_event) or {}
+    finally:
+        timer.cancel()
+    if "move" not in record:
+        return {"error": "deadline" if stop_event.is_set() else "no move"}
+    return {key: record[key] for key in ("move", "engine", "score", "depth", "stopped") if key in record}
+
+
+# Runs in a worker: answers one request, turning an error (an engine that
+# terminated, say) into an error answer so the worker carries on
+def answer_safely(fen, moves, level, deadline):
+    try:
+        return answer(fen, moves, level, deadline)
+    except Exception as error:
+        return {"error": "{}: {}".format(type(error).__name__, error)}
+
+
+# Queues requests and hands each to the next free worker. A request for the
+# same position, moves and rating as one still waiting in the queue (with no
+# earlier deadline) joins it as a batch, and its answer goes to every request
+# in the batch. When the queue is full new requests are turned away.
+class MoveServer(object):
+    def __init__(self, workers=DEFAULT_WORKERS, max_queue=MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queue = None
+        self.waiting = {} # (fen, moves, level) -> the batch for it still in the queue
+        self.queued = 0
+        self.slots = None
+        self.executor = None
+        self.dispatcher = None
+        self.received = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.busy_workers = 0
+        self.max_queue_depth = 0
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.started = time.time()
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.workers)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+        self.dispatcher = asyncio.create_task(self.dispatch())
+
+    async def stop(self):
+        self.dispatcher.cancel()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    # Answers one parsed request, returning (HTTP status, response)
+    async def submit(self, fen, moves, level, seconds):
+        self.received += 1
+        start = time.perf_counter()
+        deadline = time.time() + seconds
+        future = asyncio.get_running_loop().create_future()
+        key = (fen, tuple(moves), level)
+        batch = self.waiting.get(key)
+        if batch is not None and batch[0][3] <= deadline:
+            batch[1].append(future)
+        elif self.queued >= self.max_queue:
+            self.rejected += 1
+            return 503, {"error": "server busy", "queue_depth": self.queued}
+        else:
+            batch = ((fen, moves, level, deadline), [future])
+            self.waiting[key] = batch
+            self.queue.put_nowait(batch)
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), seconds + DEADLINE_GRACE)
+        except asyncio.TimeoutError:
+            future.cancel() # Still queued: the dispatcher skips it
+            result = {"error": "deadline"}
+        elapsed = time.perf_counter() - start
+        if result.get("error") == "deadline":
+            self.timeouts += 1
+            return 504, result
+        if "error" in result:
+            self.errors += 1
+            return 500, result
+        self.completed += 1
+        self.latencies.append(elapsed)
+        result["time"] = elapsed
+        return 200, result
+
+    # Waits for a free worker, then sends it the next batch from the queue.
+    # Until then a batch stays open to identical requests.
+    async def dispatch(self):
+        while True:
+            batch = await self.queue.get()
+            await self.slots.acquire()
+            request, futures = batch
+            key = (request[0], tuple(request[1]), request[2])
+            if self.waiting.get(key) is batch:
+                del self.waiting[key]
+            self.queued -= len(futures)
+            live = [future for future in futures if not future.done()]
+            # Requests whose deadline passed while queued are answered without work
+            if live and request[3] <= time.time():
+                for future in live:
+                    future.set_result({"error": "deadline"})
+                live = []
+            if not live:
+                self.slots.release()
+                continue
+            asyncio.create_task(self.run_batch(request, live))
+
+    async def run_batch(self, request, futures):
+        self.busy_workers += 1
+        self.batches += 1
+        self.batched_requests += len(futures)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, answer_safely, *request)
+        except Exception as error:
+            result = {"error": "worker failed: {}".format(error)}
+        finally:
+            self.busy_workers -= 1
+            self.slots.release()
+        for future in futures:
+            if not future.done():
+                future.set_result(dict(result))
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else 0.0
+
+        return {
+            "uptime": time.time() - self.started,
+            "workers": self.workers,
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queue_depth,
+            "queue_capacity": self.max_queue,
+            "busy_workers": self.busy_workers,
+            "received": self.received,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "batches": self.batches,
+            "mean_batch_size": self.batched_requests / self.batches if self.batches else 0.0,
+            "latency_p50": percentile(0.5),
+            "latency_p90": percentile(0.9),
+            "latency_p99": percentile(0.99),
+        }
+
+
+async def handle_move(request):
+    server = request.app["server"]
+    try:
+        fen, moves, level, seconds = parse_request(await request.json())
+    except ValueError:
+        return web.json_response({"error": "request must be JSON"}, status=400)
+    except RequestError as error:
+        return web.json_response({"error": str(error)}, status=400)
+    status, result = await server.submit(fen, moves, level, seconds)
+    return web.json_response(result, status=status)
+
+
+# Each message is answered as soon as its move is ready, so a client can have
+# several requests in flight on one socket and match answers by id
+async def handle_websocket(request):
+    server = request.app["server"]
+    socket = web.WebSocketResponse()
+    await socket.prepare(request)
+    lock = asyncio.Lock()
+    tasks = set()
+
+    async def reply(message):
+        try:
+            data = message.json()
+        except ValueError:
+            data = None
+        message_id = data.get("id") if isinstance(data, dict) else None
+        try:
+            status, result = await server.submit(*parse_request(data))
+        except RequestError as error:
+            status, result = 400, {"error": str(error)}
+        result["status"] = status
+        if message_id is not None:
+            result["id"] = message_id
+        async with lock:
+            if not socket.closed:
+                await socket.send_json(result)
+
+    async for message in socket:
+        if message.type == WSMsgType.TEXT:
+            task = asyncio.create_task(reply(message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    for task in list(tasks):
+        task.cancel()
+    return socket
+
+
+async def handle_metrics(request):
+    return web.json_response(request.app["server"].metrics())
+
+
+def make_app(server):
+    app = web.Application()
+    app["server"] = server
+
+    async def on_startup(app):
+        await server.start()
+
+    async def on_cleanup(app):
+        await server.stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/move", handle_move)
+    app.router.add_get("/ws", handle_websocket)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve AI moves over HTTP and WebSocket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="worker processes, each with its own Stockfish")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE, help="queued requests before new ones are turned away")
+    args = parser.parse_args()
+    server = MoveServer(args.workers, args.max_queue)
+    web.run_app(make_app(server), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Per-move telemetry for the AI. Every AI move produces a record (rating, engine
+used, depth, nodes, timings, ...) that is handed to each registered sink: the
+logging module, a JSON lines file or an in-memory ring buffer. A search can also
+be run under cProfile to see where its time goes.
+"""
+import collections
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+sinks = []
+sinks_lock = threading.Lock()
+profile_settings = {"remaining": 0, "directory": "profiles"}
+profile_lock = threading.Lock()
+
+
+# Writes each record as one log line
+class LoggingSink(object):
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("chess_ai")
+        self.level = level
+
+    def emit(self, record):
+        self.logger.log(self.level, "ai move %s", json.dumps(record, default=str))
+
+
+# Appends each record as a line of JSON to a file
+class JsonlSink(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, default=str)
+        with self.lock:
+            with open(self.path, "a") as jsonl_file:
+                jsonl_file.write(line + "\n")
+
+
+# Keeps the most recent records in memory
+class RingBufferSink(object):
+    def __init__(self, size=1000):
+        self.records = collections.deque(maxlen=size)
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def add_sink(sink):
+    with sinks_lock:
+        sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    with sinks_lock:
+        sinks.remove(sink)
+
+
+def enabled():
+    return bool(sinks)
+
+
+# Stamps the record with the time and hands it to every sink
+def emit(record):
+    if not sinks:
+        return
+    record.setdefault("timestamp", time.time())
+    with sinks_lock:
+        current_sinks = list(sinks)
+    for sink in current_sinks:
+        sink.emit(record)
+
+
+# Profiles the next count searches with cProfile. Each profile is written to
+# directory as a pstats file whose path is added to that move's record.
+def profile_next_searches(count=1, directory="profiles"):
+    with profile_lock:
+        profile_settings["remaining"] = count
+        profile_settings["directory"] = directory
+
+
+# Runs the block under cProfile if profiling was asked for, else just runs it
+@contextmanager
+def profiled(record):
+    with profile_lock:
+        take = profile_settings["remaining"] > 0
+        if take:
+            profile_settings["remaining"] -= 1
+        directory = profile_settings["directory"]
+    if not take:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "search-{}-{}.prof".format(int(time.time() * 1000), threading.get_ident()))
+        profiler.dump_stats(path)
+        record["profile"] = path
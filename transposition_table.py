@@ -0,0 +1,99 @@
+"""
+A fixed-size transposition table for the negamax search. Positions are keyed by
+their polyglot Zobrist hash and each slot remembers the depth, score, bound type
+and best move of the last search that stored it.
+"""
+import chess.polyglot
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+DEFAULT_SIZE_MB = 16
+# Rough size of one stored entry in bytes: the slot reference, the entry tuple
+# and the objects it holds (key, score and the best chess.Move)
+ENTRY_BYTES = 160
+
+
+def position_key(fen_board):
+    return chess.polyglot.zobrist_hash(fen_board)
+
+
+# Each key maps to a single slot (key modulo a power of two). A new entry
+# replaces the old one if the slot is empty, holds the same position, was
+# written by an earlier search or was searched no deeper than the new entry.
+class TranspositionTable(object):
+    def __init__(self, size_mb=DEFAULT_SIZE_MB):
+        slot_count = 1
+        while slot_count * 2 * ENTRY_BYTES <= size_mb * 1024 * 1024:
+            slot_count *= 2
+        self.mask = slot_count - 1
+        self.slots = [None] * slot_count
+        self.generation = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        self.replacements = 0
+
+    # Returns (depth, score, bound, move) for the position, or None
+    def probe(self, key):
+        entry = self.slots[key & self.mask]
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] != key:
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return entry[1:5]
+
+    # Same as probe, but leaves the counters alone
+    def peek(self, key):
+        entry = self.slots[key & self.mask]
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1:5]
+
+    def store(self, key, depth, score, bound, move):
+        index = key & self.mask
+        entry = self.slots[index]
+        if entry is not None:
+            if entry[0] == key:
+                # Keep the deeper result for this position unless it is stale,
+                # but never throw away a known best move
+                if depth < entry[1] and entry[5] == self.generation:
+                    return
+                if move is None:
+                    move = entry[4]
+            elif depth < entry[1] and entry[5] == self.generation:
+                return
+            else:
+                self.replacements += 1
+        self.slots[index] = (key, depth, score, bound, move, self.generation)
+        self.stores += 1
+
+    # Marks the start of a new search. Entries survive, but entries from
+    # earlier searches are the first to be replaced.
+    def new_search(self):
+        self.generation += 1
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+        self.generation = 0
+        self.reset_counters()
+
+    def stats(self):
+        probes = self.hits + self.misses + self.collisions
+        return {
+            "slots": len(self.slots),
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "replacements": self.replacements,
+            "hit_rate": self.hits / probes if probes else 0.0,
+        }